@@ -0,0 +1,197 @@
+"""
+Async variants of the /pwa/* and /reading/* handlers.
+
+Mounted instead of pwa_api/reading when DATABASE_ASYNC is set, so request
+handlers await the database on the event loop rather than holding a
+threadpool worker. Queries and response shaping are shared with the sync
+modules; only the I/O calls differ.
+"""
+
+import datetime as dt
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from sqlalchemy import select
+
+from .database import Item, UserSRS, Review, User, AsyncSessionLocal, get_async_db, get_current_user_async
+from .srs import get_user_engine_async
+from .cache import aget_json_many, aset_json_many, acached_json, ainvalidate
+from . import pwa_api
+from .catalog import catalog_watch
+from .pwa_api import (
+    ItemOut, ReviewIn, ReviewBatchIn, ReviewBatchOut, ForecastOut,
+    MAX_EXERCISES_PAGE, MAX_FORECAST_DAYS, NEXT_CURSOR_HEADER, ITEMS_NAMESPACE,
+)
+from .reading import (
+    ReadingItem, UserReading, ReadingOut, ReadingSummaryOut, ReadingRecommendationOut, ReadingImportIn, TrackIn,
+    READING_NAMESPACE, KNOWN_NAMESPACE, KNOWN_TTL_SECONDS, MAX_DAILY_LIMIT, MAX_SUMMARY_LIMIT, MAX_RECOMMENDED,
+    _daily_stmt, _summary_stmt, _daily_key, _reading_out, _summary_out, _conditional, _recommend, _srs_lemma_ids,
+    _import_row, _import_rows, _batches, _ndjson_batches,
+)
+
+router = APIRouter()
+
+
+async def _items_by_id(db, ids: List[int]) -> List[ItemOut]:
+    if await catalog_watch.acheck(db):
+        await ainvalidate(ITEMS_NAMESPACE)
+    found, missing = pwa_api._split_cached(ids, await aget_json_many(ITEMS_NAMESPACE, [str(i) for i in ids]))
+    if missing:
+        result = await db.execute(select(Item).where(Item.id.in_(missing)))
+        loaded = {i.id: pwa_api._item_out(i) for i in result.scalars()}
+        await aset_json_many(ITEMS_NAMESPACE, {str(k): v.model_dump() for k, v in loaded.items()})
+        found.update(loaded)
+    return [found[i] for i in ids if i in found]
+
+
+@router.get("/pwa/exercises", response_model=List[ItemOut])
+async def get_exercises_for_pwa(
+    response: Response,
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    user: User = Depends(get_current_user_async),
+    db=Depends(get_async_db),
+):
+    limit = max(1, min(limit, MAX_EXERCISES_PAGE))
+    after = pwa_api._decode_cursor(cursor)
+    ids: List[int] = []
+    next_cursor = None
+
+    if after is None or after[0] == "due":
+        rows = (await db.execute(pwa_api._due_queue_stmt(user.id, dt.datetime.utcnow(), limit, after[1:] if after else None))).all()
+        ids.extend(item_id for item_id, _ in rows)
+        if len(rows) == limit:
+            last_id, last_due = rows[-1]
+            next_cursor = pwa_api._encode_cursor("due", last_due, last_id)
+        after = None
+
+    if next_cursor is None:
+        remaining = limit - len(ids)
+        rows = (await db.execute(pwa_api._new_queue_stmt(user.id, remaining, after[1:] if after else None))).all()
+        ids.extend(item_id for item_id, _ in rows)
+        if len(rows) == remaining:
+            last_id, last_frequency = rows[-1]
+            next_cursor = pwa_api._encode_cursor("new", last_frequency, last_id)
+
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return await _items_by_id(db, ids)
+
+
+@router.post("/pwa/review")
+async def post_review_for_pwa(data: ReviewIn, user: User = Depends(get_current_user_async), db=Depends(get_async_db)):
+    item = await db.get(Item, data.item_id)
+    if not item:
+        raise HTTPException(status_code=404, detail="Item not found")
+
+    s = await db.get(UserSRS, (user.id, item.id))
+    if not s:
+        s = UserSRS(user_id=user.id, item_id=item.id, stability=0, difficulty=0)
+        db.add(s)
+
+    pwa_api._apply_review(await get_user_engine_async(db, user.id), s, data.rating)
+    db.add(Review(user_id=user.id, item_id=item.id, rating=data.rating, reviewed_at=s.last_reviewed))
+
+    await db.commit()
+    return {"ok": True}
+
+
+@router.post("/pwa/review/batch", response_model=ReviewBatchOut)
+async def post_review_batch_for_pwa(data: ReviewBatchIn, user: User = Depends(get_current_user_async), db=Depends(get_async_db)):
+    client_ids = [pwa_api._batch_client_id(r) for r in data.reviews]
+    item_ids = {r.item_id for r in data.reviews}
+    rows = (await db.execute(pwa_api._batch_state_stmt(user.id, item_ids))).all() if item_ids else []
+    seen = (await db.execute(pwa_api._seen_client_ids_stmt(user.id, client_ids))).scalars().all() if client_ids else []
+
+    out = pwa_api._apply_review_batch(db, user.id, await get_user_engine_async(db, user.id), data, client_ids, rows, seen)
+    await db.commit()
+    return out
+
+
+@router.get("/pwa/forecast", response_model=ForecastOut)
+async def get_review_forecast(days: int = 7, user: User = Depends(get_current_user_async), db=Depends(get_async_db)):
+    days = max(1, min(days, MAX_FORECAST_DAYS))
+    rows = (await db.execute(pwa_api._forecast_deck_stmt(user.id, db.bind.dialect.name))).all()
+    costs = (await db.execute(pwa_api._forecast_cost_stmt(user.id))).scalars().all()
+    return pwa_api._build_forecast(await get_user_engine_async(db, user.id), user.id, days, rows, costs)
+
+
+@router.get("/reading/daily", response_model=List[ReadingOut])
+async def get_daily_readings(request: Request, level: Optional[str] = None, limit: int = 2, db=Depends(get_async_db)):
+    limit = max(1, min(limit, MAX_DAILY_LIMIT))
+
+    async def load():
+        items = (await db.execute(_daily_stmt(level, limit))).scalars().all()
+        return [_reading_out(i).model_dump() for i in items]
+
+    return _conditional(request, await acached_json(READING_NAMESPACE, _daily_key(level, limit), load))
+
+
+@router.get("/reading/summaries", response_model=List[ReadingSummaryOut])
+async def get_reading_summaries(request: Request, level: Optional[str] = None, limit: int = 20, db=Depends(get_async_db)):
+    limit = max(1, min(limit, MAX_SUMMARY_LIMIT))
+
+    async def load():
+        return [_summary_out(r) for r in (await db.execute(_summary_stmt(level, limit))).all()]
+
+    return _conditional(request, await acached_json(READING_NAMESPACE, _daily_key(level, limit, "summary"), load))
+
+
+@router.get("/reading/items/{item_id}", response_model=ReadingOut)
+async def get_reading_item(item_id: int, request: Request, db=Depends(get_async_db)):
+    async def load():
+        it = await db.get(ReadingItem, item_id)
+        return _reading_out(it).model_dump() if it else None
+
+    payload = await acached_json(READING_NAMESPACE, f"item:{item_id}", load)
+    if payload is None:
+        raise HTTPException(status_code=404, detail="Reading item not found")
+    return _conditional(request, payload)
+
+
+@router.get("/reading/recommended", response_model=List[ReadingRecommendationOut])
+async def get_recommended_readings(level: Optional[str] = None, limit: int = 5, user: User = Depends(get_current_user_async), db=Depends(get_async_db)):
+    limit = max(1, min(limit, MAX_RECOMMENDED))
+    # The cache is read here, not inside run_sync, where a Redis round trip would block the event loop
+    srs = await acached_json(
+        KNOWN_NAMESPACE, f"user:{user.id}",
+        lambda: db.run_sync(lambda s: _srs_lemma_ids(s.connection(), user.id)), ttl=KNOWN_TTL_SECONDS,
+    )
+    return await db.run_sync(lambda s: _recommend(s.connection(), user.id, level, limit, srs))
+
+
+@router.post("/reading/track")
+async def track_reading(data: TrackIn, user: User = Depends(get_current_user_async), db=Depends(get_async_db)):
+    it = await db.get(ReadingItem, data.item_id)
+    if not it:
+        raise HTTPException(status_code=404, detail="Reading item not found")
+    db.add(UserReading(user_id=user.id, item_id=it.id, score=max(0, min(100, data.score)), time_ms=max(0, data.time_ms)))
+    await db.commit()
+    return {"ok": True}
+
+
+@router.post("/reading/import")
+async def import_readings(items: List[ReadingImportIn], user: User = Depends(get_current_user_async), db=Depends(get_async_db)):
+    rows = [_import_row(it) for it in items]
+    inserted = 0
+    for batch in _batches(rows):
+        inserted += await db.run_sync(lambda s, b=batch: _import_rows(s.connection(), b))
+    await db.commit()
+    if inserted:
+        await ainvalidate(READING_NAMESPACE)
+    return {"inserted": inserted, "skipped": len(rows) - inserted}
+
+
+@router.post("/reading/import/ndjson")
+async def import_readings_ndjson(request: Request, user: User = Depends(get_current_user_async)):
+    inserted = total = 0
+    try:
+        async for batch in _ndjson_batches(request):
+            total += len(batch)
+            async with AsyncSessionLocal() as db:
+                inserted += await db.run_sync(lambda s, b=batch: _import_rows(s.connection(), b))
+                await db.commit()
+    finally:
+        if inserted:
+            await ainvalidate(READING_NAMESPACE)
+    return {"inserted": inserted, "skipped": total - inserted}
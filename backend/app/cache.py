@@ -0,0 +1,222 @@
+"""
+Shared read-path cache.
+
+Backed by Redis when REDIS_URL is set, so entries are shared across uvicorn
+workers and Fly machines; otherwise an in-process LRU takes over. Keys live
+in namespaces ("reading", "items") that carry a version number:
+invalidate(namespace) bumps it, which orphans every key written under the
+old version without scanning for them.
+
+Cache failures are never fatal: a Redis error is logged and treated as a
+miss so requests fall through to the database.
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.getenv("REDIS_URL", "")
+CACHE_TTL_SECONDS = int(os.getenv("CACHE_TTL_SECONDS", "300"))
+LOCAL_CACHE_SIZE = int(os.getenv("LOCAL_CACHE_SIZE", "20000"))
+KEY_PREFIX = "gb"
+
+
+class LocalCache:
+    """Bounded in-process LRU with per-entry expiry."""
+
+    backend = "local"
+
+    def __init__(self, maxsize: int = LOCAL_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._counters: Dict[str, int] = {}  # namespace versions; never evicted
+        self._lock = threading.Lock()
+
+    def get_many(self, keys: List[str]) -> List[Optional[str]]:
+        now = time.monotonic()
+        out = []
+        with self._lock:
+            for key in keys:
+                if key in self._counters:
+                    out.append(str(self._counters[key]))
+                    continue
+                entry = self._data.get(key)
+                if entry is None or (entry[0] is not None and entry[0] < now):
+                    out.append(None)
+                    continue
+                self._data.move_to_end(key)
+                out.append(entry[1])
+        return out
+
+    def set_many(self, mapping: Dict[str, str], ttl: Optional[int]) -> None:
+        expires = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            for key, value in mapping.items():
+                self._data[key] = (expires, value)
+                self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+    async def aget_many(self, keys: List[str]) -> List[Optional[str]]:
+        return self.get_many(keys)
+
+    async def aset_many(self, mapping: Dict[str, str], ttl: Optional[int]) -> None:
+        self.set_many(mapping, ttl)
+
+    async def aincr(self, key: str) -> int:
+        return self.incr(key)
+
+
+class RedisCache:
+    """Redis-backed cache with sync and asyncio clients over the same keys."""
+
+    backend = "redis"
+
+    def __init__(self, url: str):
+        import redis
+        import redis.asyncio
+
+        self._errors = (redis.RedisError, OSError)
+        opts = {"socket_timeout": 0.5, "socket_connect_timeout": 0.5, "decode_responses": True}
+        self.client = redis.Redis.from_url(url, **opts)
+        self.aclient = redis.asyncio.Redis.from_url(url, **opts)
+
+    def _failed(self, op: str, e: Exception) -> None:
+        logger.warning(f"Redis {op} failed, falling through to the database: {e}")
+
+    def get_many(self, keys: List[str]) -> List[Optional[str]]:
+        try:
+            return self.client.mget(keys)
+        except self._errors as e:
+            self._failed("mget", e)
+            return [None] * len(keys)
+
+    def set_many(self, mapping: Dict[str, str], ttl: Optional[int]) -> None:
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for key, value in mapping.items():
+                pipe.set(key, value, ex=ttl)
+            pipe.execute()
+        except self._errors as e:
+            self._failed("set", e)
+
+    def incr(self, key: str) -> int:
+        try:
+            return self.client.incr(key)
+        except self._errors as e:
+            self._failed("incr", e)
+            return 0
+
+    async def aget_many(self, keys: List[str]) -> List[Optional[str]]:
+        try:
+            return await self.aclient.mget(keys)
+        except self._errors as e:
+            self._failed("mget", e)
+            return [None] * len(keys)
+
+    async def aset_many(self, mapping: Dict[str, str], ttl: Optional[int]) -> None:
+        try:
+            pipe = self.aclient.pipeline(transaction=False)
+            for key, value in mapping.items():
+                pipe.set(key, value, ex=ttl)
+            await pipe.execute()
+        except self._errors as e:
+            self._failed("set", e)
+
+    async def aincr(self, key: str) -> int:
+        try:
+            return await self.aclient.incr(key)
+        except self._errors as e:
+            self._failed("incr", e)
+            return 0
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = LocalCache()
+                if REDIS_URL:
+                    try:
+                        _cache = RedisCache(REDIS_URL)
+                    except ImportError:
+                        logger.warning("REDIS_URL is set but redis is not installed; using the in-process cache")
+    return _cache
+
+
+def _version_key(namespace: str) -> str:
+    return f"{KEY_PREFIX}:{namespace}:version"
+
+
+def _keys(namespace: str, version: Optional[str], keys: Iterable[str]) -> List[str]:
+    return [f"{KEY_PREFIX}:{namespace}:v{version or 0}:{k}" for k in keys]
+
+
+def get_json_many(namespace: str, keys: List[str]) -> List[Any]:
+    cache = get_cache()
+    version = cache.get_many([_version_key(namespace)])[0]
+    return [json.loads(v) if v is not None else None for v in cache.get_many(_keys(namespace, version, keys))]
+
+
+def set_json_many(namespace: str, mapping: Dict[str, Any], ttl: Optional[int] = CACHE_TTL_SECONDS) -> None:
+    cache = get_cache()
+    version = cache.get_many([_version_key(namespace)])[0]
+    full = _keys(namespace, version, mapping)
+    cache.set_many({k: json.dumps(v) for k, v in zip(full, mapping.values())}, ttl)
+
+
+async def aget_json_many(namespace: str, keys: List[str]) -> List[Any]:
+    cache = get_cache()
+    version = (await cache.aget_many([_version_key(namespace)]))[0]
+    return [json.loads(v) if v is not None else None for v in await cache.aget_many(_keys(namespace, version, keys))]
+
+
+async def aset_json_many(namespace: str, mapping: Dict[str, Any], ttl: Optional[int] = CACHE_TTL_SECONDS) -> None:
+    cache = get_cache()
+    version = (await cache.aget_many([_version_key(namespace)]))[0]
+    full = _keys(namespace, version, mapping)
+    await cache.aset_many({k: json.dumps(v) for k, v in zip(full, mapping.values())}, ttl)
+
+
+def cached_json(namespace: str, key: str, loader: Callable[[], Any], ttl: Optional[int] = CACHE_TTL_SECONDS) -> Any:
+    """Return the cached JSON value for key, computing and storing it on a miss."""
+    hit = get_json_many(namespace, [key])[0]
+    if hit is not None:
+        return hit
+    value = loader()
+    set_json_many(namespace, {key: value}, ttl)
+    return value
+
+
+async def acached_json(namespace: str, key: str, loader: Callable[[], Awaitable[Any]], ttl: Optional[int] = CACHE_TTL_SECONDS) -> Any:
+    hit = (await aget_json_many(namespace, [key]))[0]
+    if hit is not None:
+        return hit
+    value = await loader()
+    await aset_json_many(namespace, {key: value}, ttl)
+    return value
+
+
+def invalidate(namespace: str) -> int:
+    """Drop every key in a namespace (for importers and write endpoints)."""
+    return get_cache().incr(_version_key(namespace))
+
+
+async def ainvalidate(namespace: str) -> int:
+    return await get_cache().aincr(_version_key(namespace))
@@ -0,0 +1,199 @@
+"""
+Catalog reloads without downtime.
+
+load_catalog() bulk-loads the new rows into an unindexed staging table,
+indexes it, and then merges it into `items` in one transaction. Rows are
+matched on Item.natural_key, so an item keeps its id (and with it every
+user's progress) across reloads. Items of the same kind that are no longer
+in the catalog are retired, not deleted. Readers see either the old catalog
+or the new one, never a mix.
+
+Every load bumps the `items` row of catalog_meta. API processes poll that
+version (at most every CATALOG_POLL_SECONDS) and drop their cached items
+when it moves, so they serve the new catalog without a restart, Redis or not.
+"""
+
+import csv
+import io
+import os
+import datetime as dt
+import threading
+import time
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import Column, Index, Integer, MetaData, String, Table, bindparam, exists, false, func, insert, select, true, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.schema import CreateTable
+
+from .database import CatalogMeta, Item, engine
+
+CATALOG_NAME = "items"
+CATALOG_POLL_SECONDS = float(os.getenv("CATALOG_POLL_SECONDS", "5"))
+STAGING_TABLE = "items_staging"
+STAGING_COLUMNS = ("natural_key", "german", "english", "frequency", "pattern", "source")
+
+staging = Table(
+    STAGING_TABLE, MetaData(),
+    Column("natural_key", String, nullable=False),
+    Column("german", String, nullable=False),
+    Column("english", String, nullable=False),
+    Column("frequency", Integer),
+    Column("pattern", String),
+    Column("source", String),
+)
+# Built after the bulk load, which is much cheaper than maintaining it row by row
+staging_key_index = Index("ix_items_staging_natural_key", staging.c.natural_key, unique=True)
+staging_german_index = Index("ix_items_staging_german", staging.c.german)
+
+
+def _copy_rows(conn, rows):
+    buf = io.StringIO()
+    csv.writer(buf).writerows([r[c] for c in STAGING_COLUMNS] for r in rows)
+    buf.seek(0)
+    with conn.connection.dbapi_connection.cursor() as cur:
+        cur.copy_expert(f"COPY {STAGING_TABLE} ({', '.join(STAGING_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buf)
+
+
+def _stage(rows: Iterable[dict], chunk_size: int) -> int:
+    """Fill a fresh staging table; the first row wins for a repeated key."""
+    seen, chunk, staged = set(), [], 0
+    with engine.begin() as conn:
+        staging.drop(conn, checkfirst=True)
+        conn.execute(CreateTable(staging))  # without its indexes
+        write = _copy_rows if conn.dialect.name == "postgresql" else lambda c, r: c.execute(insert(staging), r)
+        for row in rows:
+            if row["natural_key"] in seen:
+                continue
+            seen.add(row["natural_key"])
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                write(conn, chunk)
+                staged += len(chunk)
+                chunk = []
+        if chunk:
+            write(conn, chunk)
+            staged += len(chunk)
+        staging_key_index.create(conn)
+        staging_german_index.create(conn)
+        conn.exec_driver_sql(f"ANALYZE {STAGING_TABLE}")
+    return staged
+
+
+def _adopt_legacy(conn, legacy) -> int:
+    """Give the catalog's keys to `legacy` items loaded before natural keys existed, matched on german text."""
+    items = Item.__table__
+    keys = dict(conn.execute(
+        select(staging.c.german, func.min(staging.c.natural_key)).group_by(staging.c.german)
+    ).all())
+    taken = set()
+    adopt = []
+    # Lowest id first, so a duplicated legacy row keeps the older item's progress
+    for item_id, german in conn.execute(select(items.c.id, items.c.german).where(items.c.natural_key.is_(None), legacy).order_by(items.c.id)):
+        key = keys.get(german)
+        if key is not None and key not in taken:
+            taken.add(key)
+            adopt.append({"_id": item_id, "natural_key": key})
+    if not adopt:
+        return 0
+    claimed = set(conn.execute(select(items.c.natural_key).where(items.c.natural_key.in_(taken))).scalars())
+    adopt = [a for a in adopt if a["natural_key"] not in claimed]
+    if adopt:
+        conn.execute(update(items).where(items.c.id == bindparam("_id")).values(natural_key=bindparam("natural_key")), adopt)
+    return len(adopt)
+
+
+def _merge(conn, kind: str, legacy) -> Dict[str, int]:
+    items = Item.__table__
+    values = ("german", "english", "frequency", "pattern", "source")
+    dialect_insert = postgresql.insert if conn.dialect.name == "postgresql" else sqlite.insert
+    # WHERE true keeps SQLite from reading ON CONFLICT as part of the SELECT
+    stmt = dialect_insert(items).from_select(
+        ["natural_key", *values],
+        select(staging.c.natural_key, *(staging.c[c] for c in values)).where(true()),
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[items.c.natural_key],
+        set_={**{c: stmt.excluded[c] for c in values}, "retired": False},
+    )
+    adopted = _adopt_legacy(conn, legacy) if legacy is not None else 0
+    merged = conn.execute(stmt).rowcount
+    retired = conn.execute(
+        update(items)
+        .where(
+            items.c.natural_key.like(f"{kind}:%"),
+            items.c.retired == false(),
+            ~exists().where(staging.c.natural_key == items.c.natural_key),
+        )
+        .values(retired=True)
+    ).rowcount
+    orphaned = 0
+    if legacy is not None:
+        # Legacy rows left keyless: dropped from the catalog, or a duplicate of an adopted german
+        orphaned = conn.execute(
+            update(items).where(items.c.natural_key.is_(None), items.c.retired == false(), legacy).values(retired=True)
+        ).rowcount
+    return {"adopted": adopted, "merged": merged, "retired": retired, "orphaned": orphaned}
+
+
+def bump_catalog_version(conn) -> int:
+    """Tell running API processes the catalog changed. Returns the new version."""
+    meta = CatalogMeta.__table__
+    now = dt.datetime.utcnow()
+    if not conn.execute(
+        update(meta).where(meta.c.name == CATALOG_NAME).values(version=meta.c.version + 1, updated_at=now)
+    ).rowcount:
+        conn.execute(insert(meta).values(name=CATALOG_NAME, version=1, updated_at=now))
+    return conn.execute(select(meta.c.version).where(meta.c.name == CATALOG_NAME)).scalar_one()
+
+
+def load_catalog(rows: Iterable[dict], kind: str, legacy=None, chunk_size: int = 5000) -> Dict[str, int]:
+    """
+    Replace the `kind` part of the catalog with rows (dicts with STAGING_COLUMNS;
+    natural_key must start with "<kind>:"). `legacy` is a condition on items
+    picking keyless rows from older loads that may be adopted by german text;
+    those left unadopted are retired ("orphaned"). Returns counts and the new
+    version.
+    """
+    stats = {"staged": _stage(rows, chunk_size)}
+    try:
+        with engine.begin() as conn:
+            stats.update(_merge(conn, kind, legacy))
+            stats["version"] = bump_catalog_version(conn)
+    finally:
+        with engine.begin() as conn:
+            staging.drop(conn, checkfirst=True)
+    return stats
+
+
+_version_stmt = select(CatalogMeta.version).where(CatalogMeta.name == CATALOG_NAME)
+
+
+class CatalogWatch:
+    """Per-process view of the catalog version, refreshed at most every `poll` seconds."""
+
+    def __init__(self, poll: float):
+        self.poll = poll
+        self.version: Optional[int] = None
+        self._checked = float("-inf")
+        self._lock = threading.Lock()
+
+    def due(self) -> bool:
+        return time.monotonic() - self._checked >= self.poll
+
+    def observe(self, version: Optional[int]) -> bool:
+        """Record a polled version; True when it differs from the last one seen."""
+        version = version or 0
+        with self._lock:
+            self._checked = time.monotonic()
+            changed = self.version is not None and version != self.version
+            self.version = version
+        return changed
+
+    def check(self, db) -> bool:
+        return self.due() and self.observe(db.execute(_version_stmt).scalar())
+
+    async def acheck(self, db) -> bool:
+        return self.due() and self.observe((await db.execute(_version_stmt)).scalar())
+
+
+catalog_watch = CatalogWatch(CATALOG_POLL_SECONDS)
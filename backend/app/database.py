@@ -8,13 +8,46 @@ DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./srs.db")
 connect_args = {"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
 engine = create_engine(DATABASE_URL, echo=False, future=True, connect_args=connect_args)
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
+
+# Opt-in async mode: asyncpg (or aiosqlite) engine used by the async_api handlers.
+DATABASE_ASYNC = os.getenv("DATABASE_ASYNC", "").lower() in ("1", "true", "yes")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "20"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "30"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1").lower() in ("1", "true", "yes")
+
+def async_database_url(url: str) -> str:
+    for prefix in ("postgresql+psycopg2://", "postgresql://", "postgres://"):
+        if url.startswith(prefix):
+            return "postgresql+asyncpg://" + url[len(prefix):]
+    if url.startswith("sqlite:///"):
+        return "sqlite+aiosqlite:///" + url[len("sqlite:///"):]
+    return url
+
+async_engine = None
+AsyncSessionLocal = None
+if DATABASE_ASYNC:
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+    pool_args = {} if DATABASE_URL.startswith("sqlite") else {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+    }
+    async_engine = create_async_engine(
+        async_database_url(DATABASE_URL), echo=False, pool_pre_ping=DB_POOL_PRE_PING, **pool_args
+    )
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 import datetime as dt
+import threading
+import time
+from collections import OrderedDict
 from typing import Optional
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
 from passlib.context import CryptContext
-from sqlalchemy import Column, Integer, String, DateTime, Float, ForeignKey
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, Float, Boolean, ForeignKey, Index, Text, event, func, inspect, select, false
+from sqlalchemy.schema import CreateColumn, CreateIndex
 
 Base = declarative_base()
 
@@ -33,9 +66,37 @@ class Item(Base):
     frequency = Column(Integer, default=0)
     pattern = Column(String, nullable=True)
     source = Column(String, nullable=True)
+    audio_hash = Column(String(64), nullable=True)  # sha256 of the item's audio in the media store (/media/{hash})
+    # Stable identity across catalog reloads ("collocation:<german>"); NULL for deck imports
+    natural_key = Column(String, unique=True, index=True, nullable=True)
+    # Removed from its source deck: no longer offered as new, kept for existing progress
+    retired = Column(Boolean, nullable=False, default=False, server_default=false())
+
+# New-card order: a NULL frequency ranks as 0, so keysets and NULL placement agree on every backend
+item_rank = func.coalesce(Item.frequency, 0)
+Index("ix_items_retired_rank_id", Item.retired, item_rank, Item.id)
+
+class AnkiNote(Base):
+    """Manifest of imported Anki notes, for incremental re-imports."""
+    __tablename__ = "anki_notes"
+    deck = Column(String, primary_key=True)
+    guid = Column(String, primary_key=True)
+    mod = Column(BigInteger, nullable=False)  # note modification time (epoch seconds)
+    content_hash = Column(String(40), nullable=False)  # sha1 of the imported german/english
+    item_id = Column(Integer, ForeignKey("items.id"))  # NULL for a note that was skipped, never imported
+    deleted = Column(Boolean, nullable=False, default=False)  # tombstone: gone from the deck
+
+class CatalogMeta(Base):
+    """Version counter bumped by every catalog load; API processes poll it."""
+    __tablename__ = "catalog_meta"
+    name = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=dt.datetime.utcnow)
 
 class UserSRS(Base):
     __tablename__ = "user_srs"
+    # Serves the due-first exercise queue: WHERE user_id = ? AND due <= now ORDER BY due
+    __table_args__ = (Index("ix_user_srs_user_due", "user_id", "due", "item_id"),)
     user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
     item_id = Column(Integer, ForeignKey("items.id"), primary_key=True)
     stability = Column(Float, default=0)
@@ -43,14 +104,27 @@ class UserSRS(Base):
     due = Column(DateTime, default=dt.datetime.utcnow)
     last_reviewed = Column(DateTime, default=None)
 
+class UserFSRSParams(Base):
+    """Per-user FSRS weights fitted offline by scripts/optimize_fsrs_parameters.py."""
+    __tablename__ = "user_fsrs_params"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    parameters = Column(Text, nullable=False)  # JSON list of floats
+    review_count = Column(Integer, default=0)
+    fitted_at = Column(DateTime, default=dt.datetime.utcnow)
+
 class Review(Base):
     __tablename__ = "reviews"
+    __table_args__ = (
+        Index("uq_reviews_user_client", "user_id", "client_id", unique=True),
+        Index("ix_reviews_user_reviewed", "user_id", "reviewed_at"),
+    )
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     item_id = Column(Integer, ForeignKey("items.id"))
     rating = Column(Integer)  # 1-4 (Again, Hard, Good, Easy)
     response_ms = Column(Integer, default=0)
     reviewed_at = Column(DateTime, default=dt.datetime.utcnow)
+    client_id = Column(String, nullable=True)  # idempotency key for offline batch sync
 
 # Auth setup
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -59,6 +133,75 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 JWT_SECRET = os.getenv("JWT_SECRET", "dev_secret_change_me")
 JWT_ALGO = "HS256"
 ACCESS_EXPIRES_MIN = int(os.getenv("ACCESS_EXPIRES_MIN", "60"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+
+class IdentityCache:
+    """
+    Bounded LRU of token subject -> user columns with a TTL.
+
+    Lets get_current_user skip the users lookup on the hot path. Entries are
+    per process: invalidate() drops them here immediately, other workers pick
+    up a change once the TTL expires.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: str, values: dict) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, values)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key: Optional[str] = None) -> None:
+        """Drop one subject, or everything when key is None."""
+        with self._lock:
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            }
+
+identity_cache = IdentityCache(USER_CACHE_SIZE, USER_CACHE_TTL_SECONDS)
+
+def invalidate_user(email: str) -> None:
+    """Call after a password change or account deletion."""
+    identity_cache.invalidate(email)
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_cached_user(mapper, connection, target):
+    invalidate_user(target.email)
 
 def get_db():
     db = SessionLocal()
@@ -79,7 +222,7 @@ def create_access_token(data: dict, expires_delta: Optional[dt.timedelta] = None
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, JWT_SECRET, algorithm=JWT_ALGO)
 
-def get_current_user(db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)) -> User:
+def _token_subject(token: str) -> str:
     credentials_exc = HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials")
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGO])
@@ -88,11 +231,111 @@ def get_current_user(db: Session = Depends(get_db), token: str = Depends(oauth2_
             raise credentials_exc
     except JWTError:
         raise credentials_exc
-    user = db.query(User).filter(User.email == email).first()
+    return email
+
+def _resolve_user(email: str, user: Optional[User]) -> User:
     if not user:
-        raise credentials_exc
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials")
+    identity_cache.put(email, {"id": user.id, "email": user.email, "created_at": user.created_at})
     return user
 
+def get_current_user(db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)) -> User:
+    email = _token_subject(token)
+    cached = identity_cache.get(email)
+    if cached is not None:
+        # Detached snapshot: carries id/email/created_at for handlers, never flushed.
+        return User(**cached)
+    return _resolve_user(email, db.query(User).filter(User.email == email).first())
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+async def get_current_user_async(db=Depends(get_async_db), token: str = Depends(oauth2_scheme)) -> User:
+    email = _token_subject(token)
+    cached = identity_cache.get(email)
+    if cached is not None:
+        return User(**cached)
+    result = await db.execute(select(User).where(User.email == email))
+    return _resolve_user(email, result.scalars().first())
+
+
+def upsert(conn, table, rows, index_elements, update_columns=None):
+    """INSERT ... ON CONFLICT for SQLite and Postgres; conflicting rows are
+    updated with ``update_columns`` or skipped when it is None."""
+    if not rows:
+        return None
+    if conn.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    stmt = insert(table)
+    if update_columns:
+        stmt = stmt.on_conflict_do_update(
+            index_elements=index_elements,
+            set_={c: stmt.excluded[c] for c in update_columns},
+        )
+    else:
+        stmt = stmt.on_conflict_do_nothing(index_elements=index_elements)
+    return conn.execute(stmt, rows)
+
+
+# Columns and indexes added to tables after they first shipped. create_all()
+# only creates missing tables, so upgrade_schema() adds these to existing ones.
+ADDED_COLUMNS = {
+    "reviews": ["client_id"],
+    "items": ["audio_hash", "retired", "natural_key"],
+    "reading_items": ["content_hash", "lemma_ids", "lemma_counts", "features_hash"],
+}
+ADDED_INDEXES = {
+    "reviews": ["uq_reviews_user_client", "ix_reviews_user_reviewed"],
+    "items": ["ix_items_retired_rank_id", "ix_items_natural_key"],
+    "user_srs": ["ix_user_srs_user_due"],
+    "reading_items": ["ix_reading_items_content_hash"],
+}
+# Columns that were NOT NULL when their table first shipped
+RELAXED_COLUMNS = {
+    "anki_notes": ["item_id"],
+}
+
+
+def _rebuild_table(conn, table) -> None:
+    """SQLite cannot drop a NOT NULL constraint: copy the rows into a table created from the model."""
+    old = f"{table.name}_old"
+    columns = ", ".join(c.name for c in table.columns)
+    conn.exec_driver_sql(f"ALTER TABLE {table.name} RENAME TO {old}")
+    for index in inspect(conn).get_indexes(old):  # index names move with the table and would clash
+        conn.exec_driver_sql(f"DROP INDEX {index['name']}")
+    table.create(conn)
+    conn.exec_driver_sql(f"INSERT INTO {table.name} ({columns}) SELECT {columns} FROM {old}")
+    conn.exec_driver_sql(f"DROP TABLE {old}")
+
+
+def upgrade_schema(bind=engine) -> None:
+    """Add ADDED_COLUMNS / ADDED_INDEXES missing from existing tables and drop NOT NULL
+    from RELAXED_COLUMNS; safe to run on every start."""
+    with bind.begin() as conn:
+        inspector = inspect(conn)
+        tables = set(inspector.get_table_names())
+        for name, table in Base.metadata.tables.items():
+            if name not in tables:
+                continue
+            have = {c["name"]: c for c in inspector.get_columns(name)}
+            for column in ADDED_COLUMNS.get(name, ()):
+                if column not in have:
+                    ddl = CreateColumn(table.c[column]).compile(dialect=conn.dialect)
+                    conn.exec_driver_sql(f"ALTER TABLE {name} ADD COLUMN {ddl}")
+            relax = [c for c in RELAXED_COLUMNS.get(name, ()) if c in have and not have[c]["nullable"]]
+            if relax and conn.dialect.name == "sqlite":
+                _rebuild_table(conn, table)
+            elif relax:
+                for column in relax:
+                    conn.exec_driver_sql(f"ALTER TABLE {name} ALTER COLUMN {column} DROP NOT NULL")
+            for index in table.indexes:
+                if index.name in ADDED_INDEXES.get(name, ()):
+                    # IF NOT EXISTS rather than checkfirst: expression indexes are not reflected
+                    conn.execute(CreateIndex(index, if_not_exists=True))
 
 def init_db():
     Base.metadata.create_all(bind=engine)
+    upgrade_schema()
@@ -30,23 +30,41 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "Content-Range", "Accept-Ranges"],
 )
 
 # Include SRS + Reading routers
 try:
-    from .srs import router as srs_router, init_db
+    from .database import init_db, DATABASE_ASYNC
     init_db()
-    app.include_router(srs_router)
+    if not DATABASE_ASYNC:
+        from .pwa_api import router as pwa_router
+        app.include_router(pwa_router)
 except Exception as e:
     logger.error(f"Failed to init/include SRS router: {e}")
 
 try:
     from .reading import router as reading_router, init_reading_db
     init_reading_db()
-    app.include_router(reading_router)
+    if not DATABASE_ASYNC:
+        app.include_router(reading_router)
 except Exception as e:
     logger.error(f"Failed to init/include Reading router: {e}")
 
+try:
+    from .media import router as media_router
+    app.include_router(media_router)
+except Exception as e:
+    logger.error(f"Failed to include media router: {e}")
+
+# Async mode serves /pwa/* and /reading/* from the async engine instead
+if DATABASE_ASYNC:
+    try:
+        from .async_api import router as async_router
+        app.include_router(async_router)
+    except Exception as e:
+        logger.error(f"Failed to include async router: {e}")
+
 # API Routes
 @app.get("/")
 async def root():
@@ -54,13 +72,17 @@ async def root():
 
 @app.get("/health")
 async def health_check():
+    from .database import identity_cache
+    from .catalog import catalog_watch
     return {
         "status": "healthy",
         "timestamp": datetime.utcnow().isoformat(),
         "services": {
             "srs": "enabled",
             "reading": "enabled"
-        }
+        },
+        "user_cache": identity_cache.stats(),
+        "catalog_version": catalog_watch.version
     }
 
 if __name__ == "__main__":
@@ -0,0 +1,130 @@
+"""
+Content-addressed media store.
+
+Deck audio is stored once under its sha256 in MEDIA_DIR (backend/media
+unless set), sharded by the first four hex digits of the hash, and served
+from /media/{sha256}. A blob never changes, so responses carry a strong
+ETag and immutable caching, and honour single-range requests for seeking.
+"""
+
+import os
+import re
+import hashlib
+import tempfile
+from pathlib import Path
+from typing import BinaryIO, Iterator, Optional, Tuple
+
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+
+# The default does not depend on the working directory, so the API and the ingest scripts agree
+MEDIA_DIR = os.path.abspath(os.getenv("MEDIA_DIR") or Path(__file__).resolve().parent.parent / "media")
+MEDIA_CHUNK = 64 * 1024
+MEDIA_CACHE_CONTROL = "public, max-age=31536000, immutable"  # content-addressed: a hash never changes
+
+HASH_RE = re.compile(r"^[0-9a-f]{64}$")
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+router = APIRouter()
+
+
+def media_path(digest: str) -> str:
+    """Sharded location of a blob: <MEDIA_DIR>/ab/cd/abcd..."""
+    return os.path.join(MEDIA_DIR, digest[:2], digest[2:4], digest)
+
+
+def store_media(stream: BinaryIO) -> Tuple[str, int, bool]:
+    """Copy a stream into the store. Returns (sha256, size, newly stored);
+    content that is already present is not written twice."""
+    os.makedirs(MEDIA_DIR, exist_ok=True)
+    h, size = hashlib.sha256(), 0
+    fd, tmp = tempfile.mkstemp(dir=MEDIA_DIR, prefix=".ingest-")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            for chunk in iter(lambda: stream.read(MEDIA_CHUNK), b""):
+                h.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+        digest = h.hexdigest()
+        path = media_path(digest)
+        if os.path.exists(path):
+            return digest, size, False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp, path)
+        tmp = None
+        return digest, size, True
+    finally:
+        if tmp is not None:
+            os.remove(tmp)
+
+
+def _content_type(head: bytes) -> str:
+    if head.startswith(b"ID3") or head[:2] in (b"\xff\xfb", b"\xff\xf3", b"\xff\xf2"):
+        return "audio/mpeg"
+    if head.startswith(b"OggS"):
+        return "audio/ogg"
+    if head.startswith(b"RIFF") and head[8:12] == b"WAVE":
+        return "audio/wav"
+    if head[4:8] == b"ftyp":
+        return "audio/mp4"
+    return "application/octet-stream"
+
+
+def _byte_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Inclusive (start, end) of a single-range header; None serves the whole file."""
+    if not header:
+        return None
+    m = RANGE_RE.match(header.strip())
+    if not m or m.groups() == ("", ""):
+        return None  # multi-range or malformed: ignoring Range is allowed
+    first, last = m.groups()
+    if first == "":  # suffix range: the last N bytes
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    if start > end or start >= size:
+        raise HTTPException(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+    return start, end
+
+
+def _read(path: str, start: int, length: int) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(MEDIA_CHUNK, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+@router.get("/media/{digest}")
+def get_media(digest: str, request: Request):
+    """A stored blob, with strong ETags, single-range requests and immutable caching."""
+    if not HASH_RE.match(digest):
+        raise HTTPException(status_code=404, detail="Media not found")
+    path = media_path(digest)
+    try:
+        size = os.path.getsize(path)
+        with open(path, "rb") as f:
+            head = f.read(12)
+    except OSError:
+        raise HTTPException(status_code=404, detail="Media not found")
+
+    etag = f'"{digest}"'
+    headers = {"ETag": etag, "Cache-Control": MEDIA_CACHE_CONTROL, "Accept-Ranges": "bytes"}
+    sent = {t.strip() for t in request.headers.get("if-none-match", "").split(",")}
+    if etag in sent or "*" in sent:
+        return Response(status_code=304, headers=headers)
+
+    byte_range = None
+    if_range = request.headers.get("if-range")
+    if if_range is None or if_range.strip() == etag:
+        byte_range = _byte_range(request.headers.get("range"), size)
+    if byte_range is None:
+        start, end, status = 0, size - 1, 200
+    else:
+        (start, end), status = byte_range, 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(_read(path, start, end - start + 1), status_code=status, media_type=_content_type(head), headers=headers)
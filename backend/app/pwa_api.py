@@ -1,12 +1,26 @@
-
-from fastapi import APIRouter, Depends
+import base64
+import datetime as dt
+import json
+from fastapi import APIRouter, Depends, HTTPException, Response
+from sqlalchemy import and_, false, func, select, tuple_
 from sqlalchemy.orm import Session
 from typing import List, Optional
 
-from .database import get_db, User, Item, UserSRS, get_current_user
-from .srs import fsrs_schedule
-from pydantic import BaseModel
-from fsrs import Rating
+from .database import get_db, User, Item, UserSRS, Review, get_current_user, item_rank
+from .srs import SchedulingEngine, get_user_engine
+from .cache import get_json_many, set_json_many, invalidate
+from .catalog import catalog_watch
+from pydantic import BaseModel, Field
+from fsrs import Card, Rating, State
+import numpy as np
+
+MAX_BATCH_REVIEWS = 500
+MAX_EXERCISES_PAGE = 100
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+ITEMS_NAMESPACE = "items"
+MAX_FORECAST_DAYS = 365
+FORECAST_COST_SAMPLE = 1000  # most recent reviews used for the per-card cost
+DEFAULT_REVIEW_SECONDS = 8.0
 
 class ItemOut(BaseModel):
     id: int
@@ -15,44 +29,330 @@ class ItemOut(BaseModel):
     frequency: Optional[int] = 0
     pattern: Optional[str] = None
     source: Optional[str] = None
+    audio_hash: Optional[str] = None  # fetch from /media/{audio_hash}
 
 class ReviewIn(BaseModel):
     item_id: int
-    rating: int  # 1-again, 2-hard, 3-good, 4-easy
+    rating: int = Field(ge=1, le=4)  # 1-again, 2-hard, 3-good, 4-easy
+
+class BatchReviewIn(BaseModel):
+    item_id: int
+    rating: int
+    reviewed_at: dt.datetime  # client clock, when the card was answered offline
+    client_id: Optional[str] = None  # idempotency key; defaults to item_id@reviewed_at
+    response_ms: int = 0
+
+class ReviewBatchIn(BaseModel):
+    reviews: List[BatchReviewIn] = Field(max_length=MAX_BATCH_REVIEWS)
+
+class BatchReviewResult(BaseModel):
+    client_id: str
+    item_id: int
+    status: str  # applied | duplicate | stale | not_found | invalid
+    due: Optional[dt.datetime] = None
+
+class ReviewBatchOut(BaseModel):
+    applied: int
+    results: List[BatchReviewResult]
+
+class ForecastDay(BaseModel):
+    date: dt.date
+    due: int
+    minutes: float
+
+class ForecastOut(BaseModel):
+    seconds_per_review: float
+    total_due: int
+    total_minutes: float
+    days: List[ForecastDay]
 
 router = APIRouter()
 
+def _utc_naive(value: dt.datetime) -> dt.datetime:
+    """Normalise to the naive-UTC datetimes stored in the database."""
+    if value.tzinfo is not None:
+        value = value.astimezone(dt.timezone.utc).replace(tzinfo=None)
+    return value
+
+def _utc_aware(value: Optional[dt.datetime]) -> Optional[dt.datetime]:
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        return value.replace(tzinfo=dt.timezone.utc)
+    return value.astimezone(dt.timezone.utc)
+
+def _card_from_srs(s: UserSRS) -> Card:
+    if s.last_reviewed is None or not s.stability:
+        return Card()
+    return Card(
+        state=State.Review,
+        stability=s.stability,
+        difficulty=s.difficulty,
+        due=_utc_aware(s.due),
+        last_review=_utc_aware(s.last_reviewed),
+    )
+
+def _apply_review(engine: SchedulingEngine, s: UserSRS, rating: int, reviewed_at: Optional[dt.datetime] = None) -> None:
+    card = engine.review(_card_from_srs(s), Rating(rating), _utc_aware(reviewed_at))
+    s.stability = card.stability
+    s.difficulty = card.difficulty
+    s.due = _utc_naive(card.due)
+    s.last_reviewed = _utc_naive(card.last_review)
+
+def _batch_client_id(r: BatchReviewIn) -> str:
+    return r.client_id or f"{r.item_id}@{_utc_naive(r.reviewed_at).isoformat()}"
+
+def _encode_cursor(phase: str, key, item_id: int) -> str:
+    if isinstance(key, dt.datetime):
+        key = key.isoformat()
+    raw = json.dumps([phase, key, item_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def _decode_cursor(cursor: Optional[str]):
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        phase, key, item_id = json.loads(raw)
+        if phase == "due":
+            return phase, dt.datetime.fromisoformat(key), int(item_id)
+        if phase == "new":
+            return phase, int(key), int(item_id)
+    except (ValueError, TypeError):
+        pass
+    raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _due_queue_stmt(user_id: int, now: dt.datetime, limit: int, after=None):
+    """Ids of cards due now for the user, oldest first; index-only on ix_user_srs_user_due."""
+    stmt = select(UserSRS.item_id, UserSRS.due).where(UserSRS.user_id == user_id, UserSRS.due <= now)
+    if after is not None:
+        stmt = stmt.where(tuple_(UserSRS.due, UserSRS.item_id) > tuple_(*after))
+    return stmt.order_by(UserSRS.due, UserSRS.item_id).limit(limit)
+
+def _new_queue_stmt(user_id: int, limit: int, after=None):
+    """Ids of live items the user has never seen, most frequent first (ix_items_retired_rank_id)."""
+    owned = select(UserSRS.item_id).where(UserSRS.user_id == user_id, UserSRS.item_id == Item.id)
+    stmt = select(Item.id, item_rank).where(Item.retired == false(), ~owned.exists())
+    if after is not None:
+        stmt = stmt.where(tuple_(item_rank, Item.id) < tuple_(*after))
+    return stmt.order_by(item_rank.desc(), Item.id.desc()).limit(limit)
+
+def _item_out(i: Item) -> ItemOut:
+    return ItemOut(id=i.id, german=i.german, english=i.english, frequency=i.frequency, pattern=i.pattern, source=i.source, audio_hash=i.audio_hash)
+
+def _split_cached(ids: List[int], cached) -> tuple:
+    found = {i: ItemOut(**c) for i, c in zip(ids, cached) if c is not None}
+    return found, [i for i in ids if i not in found]
+
+def _items_by_id(db: Session, ids: List[int]) -> List[ItemOut]:
+    """Hydrate queue ids from the shared item cache, loading only the misses."""
+    if catalog_watch.check(db):  # a catalog reload landed since the last poll
+        invalidate(ITEMS_NAMESPACE)
+    found, missing = _split_cached(ids, get_json_many(ITEMS_NAMESPACE, [str(i) for i in ids]))
+    if missing:
+        loaded = {i.id: _item_out(i) for i in db.execute(select(Item).where(Item.id.in_(missing))).scalars()}
+        set_json_many(ITEMS_NAMESPACE, {str(k): v.model_dump() for k, v in loaded.items()})
+        found.update(loaded)
+    return [found[i] for i in ids if i in found]
+
 @router.get("/pwa/exercises", response_model=List[ItemOut])
 def get_exercises_for_pwa(
+    response: Response,
     limit: int = 20,
+    cursor: Optional[str] = None,
     user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """
     Get exercises for the PWA.
+
+    Returns the user's SRS queue: due cards ordered by due date, then new
+    items by frequency. Pages are keyset-paginated; pass the value of the
+    X-Next-Cursor response header as ``cursor`` to fetch the next page.
     """
-    items = db.query(Item).order_by(Item.frequency.desc()).limit(limit).all()
-    return [ItemOut(id=i.id, german=i.german, english=i.english, frequency=i.frequency) for i in items]
+    limit = max(1, min(limit, MAX_EXERCISES_PAGE))
+    after = _decode_cursor(cursor)
+    ids: List[int] = []
+    next_cursor = None
+
+    if after is None or after[0] == "due":
+        rows = db.execute(_due_queue_stmt(user.id, dt.datetime.utcnow(), limit, after[1:] if after else None)).all()
+        ids.extend(item_id for item_id, _ in rows)
+        if len(rows) == limit:
+            last_id, last_due = rows[-1]
+            next_cursor = _encode_cursor("due", last_due, last_id)
+        after = None
+
+    if next_cursor is None:
+        remaining = limit - len(ids)
+        rows = db.execute(_new_queue_stmt(user.id, remaining, after[1:] if after else None)).all()
+        ids.extend(item_id for item_id, _ in rows)
+        if len(rows) == remaining:
+            last_id, last_frequency = rows[-1]
+            next_cursor = _encode_cursor("new", last_frequency, last_id)
+
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return _items_by_id(db, ids)
 
 @router.post("/pwa/review")
 def post_review_for_pwa(data: ReviewIn, user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     item = db.query(Item).filter(Item.id == data.item_id).first()
     if not item:
         raise HTTPException(status_code=404, detail="Item not found")
-    
+
     s = db.query(UserSRS).filter(UserSRS.user_id == user.id, UserSRS.item_id == item.id).first()
     if not s:
         s = UserSRS(user_id=user.id, item_id=item.id)
         db.add(s)
         db.flush()
 
-    card = Card(stability=s.stability, difficulty=s.difficulty)
-    card = fsrs_schedule(card, Rating(data.rating))
-
-    s.stability = card.stability
-    s.difficulty = card.difficulty
-    s.due = card.due
-    s.last_reviewed = card.last_review
+    _apply_review(get_user_engine(db, user.id), s, data.rating)
+    db.add(Review(user_id=user.id, item_id=item.id, rating=data.rating, reviewed_at=s.last_reviewed))
 
     db.commit()
     return {"ok": True}
+
+def _batch_state_stmt(user_id: int, item_ids):
+    """Item existence and the user's SRS state in one round trip."""
+    return (
+        select(Item.id, UserSRS)
+        .outerjoin(UserSRS, and_(UserSRS.item_id == Item.id, UserSRS.user_id == user_id))
+        .where(Item.id.in_(item_ids))
+    )
+
+def _seen_client_ids_stmt(user_id: int, client_ids):
+    return select(Review.client_id).where(Review.user_id == user_id, Review.client_id.in_(client_ids))
+
+def _apply_review_batch(db, user_id: int, engine: SchedulingEngine, data: ReviewBatchIn, client_ids, rows, seen) -> ReviewBatchOut:
+    """Apply a batch against preloaded state; only calls ``db.add`` so it serves sync and async sessions."""
+    known_items = {item_id for item_id, _ in rows}
+    states = {item_id: s for item_id, s in rows if s is not None}
+    seen = set(seen)
+
+    now = dt.datetime.utcnow()
+    results: List[Optional[BatchReviewResult]] = [None] * len(data.reviews)
+    order = sorted(range(len(data.reviews)), key=lambda i: (_utc_naive(data.reviews[i].reviewed_at), i))
+    applied = 0
+    for i in order:
+        r, cid = data.reviews[i], client_ids[i]
+        if cid in seen:
+            s = states.get(r.item_id)
+            results[i] = BatchReviewResult(client_id=cid, item_id=r.item_id, status="duplicate", due=s.due if s else None)
+            continue
+        if r.item_id not in known_items:
+            results[i] = BatchReviewResult(client_id=cid, item_id=r.item_id, status="not_found")
+            continue
+        if r.rating not in (1, 2, 3, 4):
+            results[i] = BatchReviewResult(client_id=cid, item_id=r.item_id, status="invalid")
+            continue
+        seen.add(cid)
+
+        reviewed_at = min(_utc_naive(r.reviewed_at), now)
+        s = states.get(r.item_id)
+        if s is None:
+            s = UserSRS(user_id=user_id, item_id=r.item_id, stability=0, difficulty=0)
+            db.add(s)
+            states[r.item_id] = s
+
+        db.add(Review(
+            user_id=user_id,
+            item_id=r.item_id,
+            rating=r.rating,
+            response_ms=max(0, r.response_ms),
+            reviewed_at=reviewed_at,
+            client_id=cid,
+        ))
+        # A review older than the card's last scheduling is logged but must not rewind it.
+        if s.last_reviewed is not None and reviewed_at < s.last_reviewed:
+            results[i] = BatchReviewResult(client_id=cid, item_id=r.item_id, status="stale", due=s.due)
+            continue
+        _apply_review(engine, s, r.rating, reviewed_at)
+        applied += 1
+        results[i] = BatchReviewResult(client_id=cid, item_id=r.item_id, status="applied", due=s.due)
+
+    return ReviewBatchOut(applied=applied, results=results)
+
+@router.post("/pwa/review/batch", response_model=ReviewBatchOut)
+def post_review_batch_for_pwa(data: ReviewBatchIn, user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    """
+    Replay reviews queued by the PWA while offline.
+
+    Reviews are applied in client-timestamp order with a single read of the
+    affected items/SRS rows and a single commit. Each review is keyed by its
+    client_id, so a retried batch reports already-stored reviews as
+    ``duplicate`` instead of scheduling them twice.
+    """
+    client_ids = [_batch_client_id(r) for r in data.reviews]
+    item_ids = {r.item_id for r in data.reviews}
+    rows = db.execute(_batch_state_stmt(user.id, item_ids)).all() if item_ids else []
+    seen = db.execute(_seen_client_ids_stmt(user.id, client_ids)).scalars().all() if client_ids else []
+
+    out = _apply_review_batch(db, user.id, get_user_engine(db, user.id), data, client_ids, rows, seen)
+    db.commit()
+    return out
+
+def _epoch_days(dialect_name: str, column):
+    """Days since 1970-01-01 as a float, computed in SQL."""
+    if dialect_name == "sqlite":
+        return func.julianday(column) - 2440587.5
+    return func.extract("epoch", column) / 86400.0
+
+def _forecast_deck_stmt(user_id: int, dialect_name: str):
+    # Day numbers are computed by the database so a 20k-card deck arrives as plain floats.
+    return select(
+        UserSRS.stability,
+        UserSRS.difficulty,
+        _epoch_days(dialect_name, UserSRS.due),
+        _epoch_days(dialect_name, UserSRS.last_reviewed),
+    ).where(UserSRS.user_id == user_id)
+
+def _forecast_cost_stmt(user_id: int):
+    return (
+        select(Review.response_ms)
+        .where(Review.user_id == user_id, Review.response_ms > 0)
+        .order_by(Review.reviewed_at.desc())
+        .limit(FORECAST_COST_SAMPLE)
+    )
+
+def _build_forecast(engine: SchedulingEngine, user_id: int, days: int, rows, costs) -> ForecastOut:
+    seconds = float(np.median(costs)) / 1000 if costs else DEFAULT_REVIEW_SECONDS
+    today = dt.datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    counts = np.zeros(days, dtype=np.int64)
+    if rows:
+        stability, difficulty, due, last = (np.array(col, dtype=np.float64) for col in zip(*rows))  # None -> nan
+        today_day = (today - dt.datetime(1970, 1, 1)).total_seconds() / 86400
+        counts = engine.simulate_due_load(
+            np.nan_to_num(stability),
+            np.nan_to_num(difficulty),
+            np.nan_to_num(due - today_day),
+            np.nan_to_num(last - today_day),
+            days,
+            seed=user_id,
+        )
+
+    minutes = counts * seconds / 60
+    return ForecastOut(
+        seconds_per_review=round(seconds, 2),
+        total_due=int(counts.sum()),
+        total_minutes=round(float(minutes.sum()), 1),
+        days=[
+            ForecastDay(date=(today + dt.timedelta(days=i)).date(), due=int(counts[i]), minutes=round(float(minutes[i]), 1))
+            for i in range(days)
+        ],
+    )
+
+@router.get("/pwa/forecast", response_model=ForecastOut)
+def get_review_forecast(days: int = 7, user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    """
+    Project daily review counts and minutes for the next ``days`` days.
+
+    The deck is loaded as columns and simulated with array operations on the
+    scheduling engine; cost per card is the median of the user's recent
+    response times.
+    """
+    days = max(1, min(days, MAX_FORECAST_DAYS))
+    # Read through Core rather than the ORM to skip per-row ORM processing.
+    rows = db.connection().execute(_forecast_deck_stmt(user.id, db.get_bind().dialect.name)).all()
+    costs = db.execute(_forecast_cost_stmt(user.id)).scalars().all()
+    return _build_forecast(get_user_engine(db, user.id), user.id, days, rows, costs)
@@ -1,12 +1,55 @@
+import json
+import threading
+import zlib
+import hashlib
 import datetime as dt
-from typing import List, Optional
+from typing import AsyncIterator, Dict, Iterable, List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException
-from pydantic import BaseModel
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import Column, Integer, String, DateTime, Text, LargeBinary, ForeignKey, bindparam, func, inspect, select, update
+from sqlalchemy.types import TypeDecorator
+from sqlalchemy.orm import Session, deferred
 
-from .srs import Base, engine, SessionLocal, get_current_user, User
+import numpy as np
+
+from .database import Base, engine, SessionLocal, get_current_user, User, Item, UserSRS, upgrade_schema, upsert
+from .cache import cached_json, invalidate
+from .text_analysis import FUNCTION_WORDS, LemmaIndex, lemma_counts, pack, tokenize
+
+READING_NAMESPACE = "reading"
+KNOWN_NAMESPACE = "known"  # per-user lemma ids from SRS items, key "user:<id>"
+MAX_DAILY_LIMIT = 10
+MAX_SUMMARY_LIMIT = 100
+IMPORT_BATCH = 1000
+TARGET_COVERAGE = 0.95
+MIN_COVERAGE = 0.85
+KNOWN_READING_SCORE = 60  # a reading tracked at or above this score marks its words as known
+KNOWN_TTL_SECONDS = 300  # how stale a user's SRS-derived vocabulary may be
+MAX_RECOMMENDED = 20
+VOCAB_LOOKUP_BATCH = 5000
+
+
+class CompressedText(TypeDecorator):
+    """Unicode text stored zlib-compressed. Rows written before compression
+    was introduced are converted by init_reading_db(); until then their plain
+    values are returned as they are."""
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else zlib.compress(value.encode("utf-8"))
+
+    def process_result_value(self, value, dialect):
+        if value is None or isinstance(value, str):
+            return value
+        try:
+            return zlib.decompress(value).decode("utf-8")
+        except zlib.error:
+            return bytes(value).decode("utf-8")
 
 
 class ReadingItem(Base):
@@ -15,14 +58,25 @@ class ReadingItem(Base):
     cefr = Column(String, index=True)  # A1..C2
     topic = Column(String, index=True)
     title = Column(String)
-    text = Column(Text, nullable=False)
+    text = Column(CompressedText, nullable=False)
     tokens = Column(Integer, default=0)
     features_json = Column(Text, default='{}')
     license = Column(String, default='')
     source_url = Column(String, default='')
+    content_hash = Column(String(64), unique=True, index=True)  # see content_hash(); NULL on rows imported before it existed
+    features_hash = Column(String(80))  # "<FEATURES_VERSION>:<content_hash>" the features were computed for
+    # Sorted uint32 lemma ids (reading_vocab.id) and aligned counts; see text_analysis.pack()
+    lemma_ids = deferred(Column(LargeBinary))
+    lemma_counts = deferred(Column(LargeBinary))
     created_at = Column(DateTime, default=dt.datetime.utcnow, index=True)
 
 
+class ReadingVocab(Base):
+    __tablename__ = "reading_vocab"
+    id = Column(Integer, primary_key=True)
+    lemma = Column(String, unique=True, nullable=False)
+
+
 class UserReading(Base):
     __tablename__ = "user_reading"
     id = Column(Integer, primary_key=True)
@@ -33,8 +87,58 @@ class UserReading(Base):
     read_at = Column(DateTime, default=dt.datetime.utcnow)
 
 
+def _compress_legacy_text(bind=engine) -> None:
+    """
+    Compress reading texts stored before CompressedText and hash rows stored
+    before content_hash, so re-importing them is a no-op. On Postgres the
+    original TEXT column is first converted to bytea, once; SQLite keeps
+    its column type and only the rows still holding text are rewritten.
+    A legacy duplicate of a story that already has the hash keeps NULL.
+    """
+    with bind.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            column = next(c for c in inspect(conn).get_columns("reading_items") if c["name"] == "text")
+            if isinstance(column["type"], LargeBinary):
+                plain = "FALSE"
+            else:
+                conn.exec_driver_sql("""ALTER TABLE reading_items ALTER COLUMN "text" TYPE bytea USING convert_to("text", 'UTF8')""")
+                plain = "TRUE"  # every row is uncompressed UTF-8 right after the conversion
+        else:
+            plain = "typeof(text) = 'text'"
+        rewrite = update(ReadingItem.__table__).where(ReadingItem.id == bindparam("_id")).values(
+            text=bindparam("text"), content_hash=bindparam("content_hash"))
+        last_id = 0
+        while True:
+            rows = conn.exec_driver_sql(
+                f"SELECT id, cefr, text, content_hash, {plain} FROM reading_items"
+                f" WHERE id > {int(last_id)} AND ({plain} OR content_hash IS NULL) ORDER BY id LIMIT {IMPORT_BATCH}"
+            ).all()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            batch = []
+            for item_id, cefr, value, digest, is_plain in rows:
+                if isinstance(value, str):
+                    text = value
+                else:
+                    text = (bytes(value) if is_plain else zlib.decompress(value)).decode("utf-8")
+                batch.append({"_id": item_id, "text": text, "content_hash": digest, "plain": is_plain,
+                              "new_hash": None if digest else content_hash(cefr or '', text)})
+            new_hashes = {r["new_hash"] for r in batch} - {None}
+            taken = set(conn.execute(select(ReadingItem.content_hash).where(ReadingItem.content_hash.in_(list(new_hashes)))).scalars())
+            for r in batch:
+                if r["new_hash"] and r["new_hash"] not in taken:
+                    taken.add(r["new_hash"])
+                    r["content_hash"] = r["new_hash"]
+            changed = [r for r in batch if r["plain"] or r["content_hash"]]
+            if changed:
+                conn.execute(rewrite, [{k: r[k] for k in ("_id", "text", "content_hash")} for r in changed])
+
+
 def init_reading_db():
     Base.metadata.create_all(bind=engine)
+    upgrade_schema()
+    _compress_legacy_text()
 
 
 def get_db():
@@ -56,6 +160,18 @@ class ReadingOut(BaseModel):
     license: Optional[str] = ''
 
 
+class ReadingSummaryOut(BaseModel):
+    id: int
+    cefr: str
+    topic: Optional[str] = ''
+    title: Optional[str] = ''
+    tokens: int
+
+
+class ReadingRecommendationOut(ReadingSummaryOut):
+    coverage: float
+
+
 class ReadingImportIn(BaseModel):
     cefr: str
     topic: Optional[str] = ''
@@ -76,13 +192,76 @@ class TrackIn(BaseModel):
 router = APIRouter()
 
 
-@router.get("/reading/daily", response_model=List[ReadingOut])
-def get_daily_readings(level: Optional[str] = None, limit: int = 2, db: Session = Depends(get_db)):
-    q = db.query(ReadingItem)
+def _daily_stmt(level: Optional[str], limit: int, *columns):
+    stmt = select(*columns) if columns else select(ReadingItem)
     if level:
-        q = q.filter(ReadingItem.cefr == level)
-    items = q.order_by(ReadingItem.created_at.desc()).limit(min(limit, 10)).all()
-    return [ReadingOut(id=i.id, cefr=i.cefr, topic=i.topic, title=i.title, text=i.text, tokens=i.tokens, source_url=i.source_url, license=i.license) for i in items]
+        stmt = stmt.where(ReadingItem.cefr == level)
+    return stmt.order_by(ReadingItem.created_at.desc(), ReadingItem.id.desc()).limit(limit)
+
+
+def _summary_stmt(level: Optional[str], limit: int):
+    """Listing projection: the text column is never read (or decompressed)."""
+    return _daily_stmt(level, limit, ReadingItem.id, ReadingItem.cefr, ReadingItem.topic, ReadingItem.title, ReadingItem.tokens)
+
+
+def _daily_key(level: Optional[str], limit: int, view: str = "daily") -> str:
+    return f"{view}:{level or '*'}:{limit}"
+
+
+def _reading_out(i: ReadingItem) -> ReadingOut:
+    return ReadingOut(id=i.id, cefr=i.cefr, topic=i.topic, title=i.title, text=i.text, tokens=i.tokens, source_url=i.source_url, license=i.license)
+
+
+def _summary_out(row) -> dict:
+    return ReadingSummaryOut(id=row.id, cefr=row.cefr, topic=row.topic, title=row.title, tokens=row.tokens or 0).model_dump()
+
+
+def _etag(payload) -> str:
+    body = json.dumps(payload, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    return '"' + hashlib.sha1(body).hexdigest() + '"'
+
+
+def _conditional(request: Request, payload) -> Response:
+    """JSON response with an ETag; 304 when the client already holds this version."""
+    etag = _etag(payload)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    sent = {t.strip().removeprefix("W/") for t in request.headers.get("if-none-match", "").split(",")}
+    if etag in sent or "*" in sent:
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(payload, headers=headers)
+
+
+@router.get("/reading/daily", response_model=List[ReadingOut])
+def get_daily_readings(request: Request, level: Optional[str] = None, limit: int = 2, db: Session = Depends(get_db)):
+    limit = max(1, min(limit, MAX_DAILY_LIMIT))
+
+    def load():
+        return [_reading_out(i).model_dump() for i in db.execute(_daily_stmt(level, limit)).scalars()]
+
+    return _conditional(request, cached_json(READING_NAMESPACE, _daily_key(level, limit), load))
+
+
+@router.get("/reading/summaries", response_model=List[ReadingSummaryOut])
+def get_reading_summaries(request: Request, level: Optional[str] = None, limit: int = 20, db: Session = Depends(get_db)):
+    """Titles-only listing in /reading/daily order; fetch a body with /reading/items/{id}."""
+    limit = max(1, min(limit, MAX_SUMMARY_LIMIT))
+
+    def load():
+        return [_summary_out(r) for r in db.execute(_summary_stmt(level, limit))]
+
+    return _conditional(request, cached_json(READING_NAMESPACE, _daily_key(level, limit, "summary"), load))
+
+
+@router.get("/reading/items/{item_id}", response_model=ReadingOut)
+def get_reading_item(item_id: int, request: Request, db: Session = Depends(get_db)):
+    def load():
+        it = db.get(ReadingItem, item_id)
+        return _reading_out(it).model_dump() if it else None
+
+    payload = cached_json(READING_NAMESPACE, f"item:{item_id}", load)
+    if payload is None:
+        raise HTTPException(status_code=404, detail="Reading item not found")
+    return _conditional(request, payload)
 
 
 @router.post("/reading/track")
@@ -96,26 +275,211 @@ def track_reading(data: TrackIn, user: User = Depends(get_current_user), db: Ses
     return {"ok": True}
 
 
+def content_hash(cefr: str, text: str) -> str:
+    """Dedupe key for a story: its level plus whitespace-normalised text."""
+    return hashlib.sha256(f"{cefr.strip().upper()}\n{' '.join(text.split())}".encode("utf-8")).hexdigest()
+
+
+def _import_row(it: ReadingImportIn) -> dict:
+    return dict(
+        cefr=it.cefr,
+        topic=it.topic or '',
+        title=it.title or '',
+        text=it.text,
+        tokens=it.tokens or len(it.text.split()),
+        features_json=it.features_json or '{}',
+        license=it.license or '',
+        source_url=it.source_url or '',
+        content_hash=content_hash(it.cefr, it.text),
+    )
+
+
+def _import_rows(conn, rows: List[dict]) -> int:
+    """
+    Insert one batch of import rows, skipping content already stored.
+
+    Existing hashes are looked up in one query so the response can report
+    counts; ON CONFLICT DO NOTHING still covers a concurrent import of the
+    same story. Returns the number of rows inserted.
+    """
+    batch = {r["content_hash"]: r for r in rows}
+    existing = set(conn.execute(select(ReadingItem.content_hash).where(ReadingItem.content_hash.in_(list(batch)))).scalars())
+    fresh = [r for h, r in batch.items() if h not in existing]
+    _attach_lemmas(conn, fresh)
+    upsert(conn, ReadingItem.__table__, fresh, ["content_hash"])
+    return len(fresh)
+
+
+def _vocab_ids(conn, lemmas: Iterable[str], create: bool = False) -> Dict[str, int]:
+    """Map lemmas to reading_vocab ids, inserting unseen ones when ``create``."""
+    lemmas = list(set(lemmas))
+    out = {}
+    for start in range(0, len(lemmas), VOCAB_LOOKUP_BATCH):
+        chunk = lemmas[start:start + VOCAB_LOOKUP_BATCH]
+        if create:
+            upsert(conn, ReadingVocab.__table__, [{"lemma": l} for l in chunk], ["lemma"])
+        out.update(conn.execute(select(ReadingVocab.lemma, ReadingVocab.id).where(ReadingVocab.lemma.in_(chunk))).all())
+    return out
+
+
+def _lemma_blobs(conn, counts: List[Dict[str, int]]) -> List[tuple]:
+    """(lemma_ids, lemma_counts) blobs per lemma -> count mapping, adding unseen lemmas to reading_vocab."""
+    vocab = _vocab_ids(conn, (l for c in counts for l in c), create=True)
+    return [pack([vocab[l] for l in c], list(c.values())) if c else (None, None) for c in counts]
+
+
+def _attach_lemmas(conn, rows: List[dict]) -> None:
+    """Precompute each row's lemma id/count blobs so recommendations never re-tokenize."""
+    blobs = _lemma_blobs(conn, [lemma_counts(r["text"]) for r in rows])
+    for r, (ids, counts) in zip(rows, blobs):
+        r["lemma_ids"], r["lemma_counts"] = ids, counts
+
+
+def _batches(rows: List[dict], size: int = IMPORT_BATCH):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+async def _ndjson_batches(request: Request, size: int = IMPORT_BATCH) -> AsyncIterator[List[dict]]:
+    """Parse an NDJSON request body into batches of import rows as it arrives."""
+    buf, batch, line_no = b"", [], 0
+    async for chunk in request.stream():
+        buf += chunk
+        *lines, buf = buf.split(b"\n")
+        for line in lines:
+            line_no += 1
+            if line.strip():
+                batch.append(_ndjson_row(line, line_no))
+            if len(batch) >= size:
+                yield batch
+                batch = []
+    if buf.strip():
+        batch.append(_ndjson_row(buf, line_no + 1))
+    if batch:
+        yield batch
+
+
+def _ndjson_row(line: bytes, line_no: int) -> dict:
+    try:
+        return _import_row(ReadingImportIn(**json.loads(line)))
+    except (ValueError, TypeError, ValidationError) as e:
+        raise HTTPException(status_code=422, detail=f"Line {line_no}: {e}")
+
+
+_lemma_index = LemmaIndex()
+_lemma_index_lock = threading.Lock()
+
+
+def _refresh_lemma_index(conn) -> LemmaIndex:
+    """
+    Bring the in-process index up to date and return it.
+
+    Readings past the last indexed id are appended. Ids are not committed in
+    order, though: a concurrent import can commit a lower id after a higher
+    one was indexed. Counting the rows at or below the last id catches that
+    (and deletions), and the index is then rebuilt from scratch.
+    """
+    global _lemma_index
+    indexed = ReadingItem.lemma_ids.is_not(None)
+    with _lemma_index_lock:
+        index = _lemma_index
+        below = conn.execute(
+            select(func.count()).select_from(ReadingItem).where(ReadingItem.id <= index.last_id, indexed)
+        ).scalar_one()
+        if below != index.item_ids.size:
+            index = LemmaIndex()
+        stmt = (
+            select(ReadingItem.id, ReadingItem.cefr, ReadingItem.lemma_ids, ReadingItem.lemma_counts)
+            .where(ReadingItem.id > index.last_id, indexed)
+            .order_by(ReadingItem.id)
+        )
+        index.extend(conn.execute(stmt))
+        _lemma_index = index
+    return index
+
+
+def _srs_lemma_ids(conn, user_id: int) -> List[int]:
+    phrases = conn.execute(select(Item.german).join(UserSRS, UserSRS.item_id == Item.id).where(UserSRS.user_id == user_id)).scalars()
+    words = set(FUNCTION_WORDS)
+    for phrase in phrases:
+        words.update(tokenize(phrase))
+    return list(_vocab_ids(conn, words).values())
+
+
+def _known_lemmas(conn, index: LemmaIndex, user_id: int, srs: List[int]) -> np.ndarray:
+    """Words the user knows: function words and their SRS items (``srs``), plus readings they scored well on."""
+    read = conn.execute(select(UserReading.item_id).where(UserReading.user_id == user_id, UserReading.score >= KNOWN_READING_SCORE)).scalars()
+    return index.known_mask([np.asarray(srs, dtype=np.intp), *(index.lemmas_of(i) for i in read)])
+
+
+def _recommend(conn, user_id: int, level: Optional[str], limit: int, srs: List[int]) -> List[dict]:
+    """
+    Unread readings whose known-token coverage is closest to TARGET_COVERAGE.
+    ``srs`` is the user's cached _srs_lemma_ids(); callers fetch it with the
+    cache client matching their I/O model.
+
+    Coverage for every indexed reading is one gather-and-reduce over the
+    CSR lemma index; only the chosen few are then loaded from the database.
+    """
+    index = _refresh_lemma_index(conn)
+    coverage = index.coverage(_known_lemmas(conn, index, user_id, srs))
+    eligible = coverage >= MIN_COVERAGE
+    if level:
+        eligible &= index.cefr == level
+    seen = conn.execute(select(UserReading.item_id).where(UserReading.user_id == user_id)).scalars().all()
+    eligible[[index.row_of[i] for i in seen if i in index.row_of]] = False
+
+    rows = np.flatnonzero(eligible)
+    rows = rows[np.argsort(np.abs(coverage[rows] - TARGET_COVERAGE), kind="stable")[:limit]]
+    ids = [int(i) for i in index.item_ids[rows]]
+    summaries = {r.id: r for r in conn.execute(_summary_stmt(None, len(ids)).where(ReadingItem.id.in_(ids)))}
+    return [
+        {**_summary_out(summaries[i]), "coverage": round(float(coverage[row]), 4)}
+        for i, row in zip(ids, rows) if i in summaries
+    ]
+
+
+def _import_ndjson_batch(rows: List[dict]) -> int:
+    with engine.begin() as conn:
+        return _import_rows(conn, rows)
+
+
+@router.get("/reading/recommended", response_model=List[ReadingRecommendationOut])
+def get_recommended_readings(level: Optional[str] = None, limit: int = 5, user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    """Readings pitched at ~95% known words for this user (i+1 input)."""
+    conn = db.connection()
+    srs = cached_json(KNOWN_NAMESPACE, f"user:{user.id}", lambda: _srs_lemma_ids(conn, user.id), ttl=KNOWN_TTL_SECONDS)
+    return _recommend(conn, user.id, level, max(1, min(limit, MAX_RECOMMENDED)), srs)
+
+
 @router.post("/reading/import")
 def import_readings(items: List[ReadingImportIn], user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     # Admin-lite: allow authenticated import; add proper role later
-    inserted = 0
-    for it in items:
-        # Basic dedupe by title+cefr+len(text)
-        exists = db.query(ReadingItem).filter(ReadingItem.cefr == it.cefr, ReadingItem.title == it.title, ReadingItem.tokens == (it.tokens or 0)).first()
-        if exists:
-            continue
-        db.add(ReadingItem(
-            cefr=it.cefr,
-            topic=it.topic or '',
-            title=it.title or '',
-            text=it.text,
-            tokens=it.tokens or len(it.text.split()),
-            features_json=it.features_json or '{}',
-            license=it.license or '',
-            source_url=it.source_url or ''
-        ))
-        inserted += 1
+    rows = [_import_row(it) for it in items]
+    conn = db.connection()
+    inserted = sum(_import_rows(conn, batch) for batch in _batches(rows))
     db.commit()
-    return {"inserted": inserted}
+    if inserted:
+        invalidate(READING_NAMESPACE)
+    return {"inserted": inserted, "skipped": len(rows) - inserted}
+
+
+@router.post("/reading/import/ndjson")
+async def import_readings_ndjson(request: Request, user: User = Depends(get_current_user)):
+    """
+    Streaming import: one ReadingImportIn JSON object per line.
 
+    The body is consumed in batches of IMPORT_BATCH, each committed on its
+    own, so memory stays flat for any corpus size. A malformed line fails
+    the request with 422 naming the line; batches before it are kept, and
+    re-sending the file is safe because stored stories are skipped.
+    """
+    inserted = total = 0
+    try:
+        async for batch in _ndjson_batches(request):
+            total += len(batch)
+            inserted += await run_in_threadpool(_import_ndjson_batch, batch)
+    finally:
+        if inserted:
+            invalidate(READING_NAMESPACE)
+    return {"inserted": inserted, "skipped": total - inserted}
@@ -1,8 +1,250 @@
+"""
+FSRS scheduling engine.
 
-from fsrs import Scheduler, Card, Rating
+One SchedulingEngine is built per parameter set and reused for the life of the
+process. Besides single-card reviews it exposes the FSRS formulas over NumPy
+arrays, so a whole deck can be scored in one call.
+"""
+
+import json
+from functools import lru_cache
 from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from fsrs import Scheduler, Card, Rating
+from sqlalchemy import select
+
+from .database import Review, UserFSRSParams
+
+MIN_DIFFICULTY = 1.0
+MAX_DIFFICULTY = 10.0
+STABILITY_MIN = 0.001
+
+class SchedulingEngine:
+    def __init__(
+        self,
+        parameters: Optional[Sequence[float]] = None,
+        desired_retention: float = 0.9,
+        maximum_interval: int = 36500,
+        enable_fuzzing: bool = True,
+    ):
+        kwargs = {"parameters": tuple(parameters)} if parameters is not None else {}
+        self.scheduler = Scheduler(
+            desired_retention=desired_retention,
+            maximum_interval=maximum_interval,
+            enable_fuzzing=enable_fuzzing,
+            **kwargs,
+        )
+        self.parameters = tuple(self.scheduler.parameters)
+        self.desired_retention = desired_retention
+        self.maximum_interval = maximum_interval
+        self.w = np.asarray(self.parameters, dtype=np.float64)
+        self.decay = -self.w[20]
+        self.factor = 0.9 ** (1 / self.decay) - 1
+
+    # -- single card -------------------------------------------------------
+
+    def review(self, card: Card, rating: Rating, review_datetime: Optional[datetime] = None) -> Card:
+        card, _ = self.scheduler.review_card(card, rating, review_datetime)
+        return card
+
+    # -- vectorised --------------------------------------------------------
+
+    def retrievability(self, stability, elapsed_days) -> np.ndarray:
+        """Probability of recall after ``elapsed_days`` (whole days, as FSRS counts them)."""
+        s = np.maximum(np.asarray(stability, dtype=np.float64), STABILITY_MIN)
+        t = np.maximum(np.floor(np.asarray(elapsed_days, dtype=np.float64)), 0.0)
+        return (1 + self.factor * t / s) ** self.decay
+
+    def next_interval(self, stability, desired_retention: Optional[float] = None) -> np.ndarray:
+        """Whole-day intervals (unfuzzed) at which retrievability drops to the target."""
+        r = self.desired_retention if desired_retention is None else desired_retention
+        s = np.asarray(stability, dtype=np.float64)
+        days = np.rint(s / self.factor * (r ** (1 / self.decay) - 1))
+        return np.clip(days, 1, self.maximum_interval).astype(np.int64)
+
+    def initial_stability(self, rating) -> np.ndarray:
+        return np.maximum(self.w[np.asarray(rating, dtype=np.int64) - 1], STABILITY_MIN)
+
+    def initial_difficulty(self, rating, clamp: bool = True) -> np.ndarray:
+        g = np.asarray(rating, dtype=np.float64)
+        d = self.w[4] - np.exp(self.w[5] * (g - 1)) + 1
+        return np.clip(d, MIN_DIFFICULTY, MAX_DIFFICULTY) if clamp else d
+
+    def next_difficulty(self, difficulty, rating) -> np.ndarray:
+        d = np.asarray(difficulty, dtype=np.float64)
+        g = np.asarray(rating, dtype=np.float64)
+        delta = -self.w[6] * (g - 3)
+        damped = d + (10.0 - d) * delta / 9.0
+        reverted = self.w[7] * self.initial_difficulty(4, clamp=False) + (1 - self.w[7]) * damped
+        return np.clip(reverted, MIN_DIFFICULTY, MAX_DIFFICULTY)
+
+    def next_stability(self, stability, difficulty, retrievability, rating) -> np.ndarray:
+        """Post-review stability for cards reviewed at least a day after the last review."""
+        w = self.w
+        s = np.asarray(stability, dtype=np.float64)
+        d = np.asarray(difficulty, dtype=np.float64)
+        r = np.asarray(retrievability, dtype=np.float64)
+        g = np.asarray(rating, dtype=np.int64)
+
+        hard_penalty = np.where(g == 2, w[15], 1.0)
+        easy_bonus = np.where(g == 4, w[16], 1.0)
+        recall = s * (
+            1 + np.exp(w[8]) * (11 - d) * s ** -w[9] * (np.exp((1 - r) * w[10]) - 1) * hard_penalty * easy_bonus
+        )
+        forget = np.minimum(
+            w[11] * d ** -w[12] * ((s + 1) ** w[13] - 1) * np.exp((1 - r) * w[14]),
+            s / np.exp(w[17] * w[18]),
+        )
+        return np.maximum(np.where(g == 1, forget, recall), STABILITY_MIN)
+
+    def short_term_stability(self, stability, rating) -> np.ndarray:
+        """Post-review stability for same-day reviews."""
+        w = self.w
+        s = np.asarray(stability, dtype=np.float64)
+        g = np.asarray(rating, dtype=np.float64)
+        increase = np.exp(w[17] * (g - 3 + w[18])) * s ** -w[19]
+        increase = np.where(g >= 2, np.maximum(increase, 1.0), increase)
+        return np.maximum(s * increase, STABILITY_MIN)
+
+    def schedule_batch(self, stability, difficulty, elapsed_days, rating=Rating.Good):
+        """
+        Score and reschedule many cards at once.
+
+        ``stability``/``difficulty``/``elapsed_days`` are equal-length arrays
+        (``rating`` may be a scalar or an array). Cards with a non-positive or
+        NaN stability are treated as new. Returns a dict of arrays:
+        retrievability, stability, difficulty and interval (days).
+        """
+        s = np.asarray(stability, dtype=np.float64)
+        d = np.asarray(difficulty, dtype=np.float64)
+        t = np.asarray(elapsed_days, dtype=np.float64)
+        g = np.broadcast_to(np.asarray(int(rating) if isinstance(rating, Rating) else rating, dtype=np.int64), s.shape)
+
+        new = ~(s > 0)
+        s_known = np.where(new, 1.0, s)
+        d_known = np.where(new, MIN_DIFFICULTY, d)
+        r = np.where(new, 0.0, self.retrievability(s_known, t))
+
+        s_next = np.where(
+            t < 1,
+            self.short_term_stability(s_known, g),
+            self.next_stability(s_known, d_known, r, g),
+        )
+        d_next = self.next_difficulty(d_known, g)
+        s_next = np.where(new, self.initial_stability(g), s_next)
+        d_next = np.where(new, self.initial_difficulty(g), d_next)
+        return {
+            "retrievability": r,
+            "stability": s_next,
+            "difficulty": d_next,
+            "interval": self.next_interval(s_next),
+        }
+
+    def simulate_due_load(self, stability, difficulty, due_day, last_review_day, days: int, seed: Optional[int] = None) -> np.ndarray:
+        """
+        Project the number of reviews falling on each of the next ``days`` days.
+
+        ``due_day``/``last_review_day`` are day offsets from today (negative for
+        the past; overdue cards fall on day 0). Each simulated day reviews every
+        card due that day as one array step: recall is drawn from the card's
+        retrievability (never-reviewed cards count as recalled), failed cards
+        come back the next day and recalled ones at their next FSRS interval.
+        """
+        s = np.array(stability, dtype=np.float64)
+        d = np.array(difficulty, dtype=np.float64)
+        due = np.maximum(np.floor(np.asarray(due_day, dtype=np.float64)), 0).astype(np.int64)
+        last = np.floor(np.asarray(last_review_day, dtype=np.float64))
+        rng = np.random.default_rng(seed)
+        counts = np.zeros(days, dtype=np.int64)
+
+        for day in range(days):
+            idx = np.flatnonzero(due == day)
+            if not idx.size:
+                continue
+            counts[day] = idx.size
+            new = ~(s[idx] > 0)
+            elapsed = np.where(new, 0.0, day - last[idx])
+            recalled = new | (rng.random(idx.size) < self.retrievability(s[idx], elapsed))
+            out = self.schedule_batch(s[idx], d[idx], elapsed, np.where(recalled, int(Rating.Good), int(Rating.Again)))
+            s[idx] = out["stability"]
+            d[idx] = out["difficulty"]
+            last[idx] = day
+            due[idx] = day + np.where(recalled, out["interval"], 1)
+        return counts
+
+    def replay(self, reviews: Sequence[tuple]) -> Dict[int, Card]:
+        """
+        Rebuild card states from a review history.
+
+        ``reviews`` are ``(item_id, rating, reviewed_at, ...)`` tuples in
+        chronological order, with naive-UTC ``reviewed_at``. Returns the final
+        Card per item_id.
+        """
+        cards: Dict[int, Card] = {}
+        for item_id, rating, reviewed_at, *_ in reviews:
+            if rating not in (1, 2, 3, 4):
+                continue
+            card = cards.get(item_id) or Card()
+            cards[item_id] = self.review(card, Rating(rating), reviewed_at.replace(tzinfo=timezone.utc))
+        return cards
+
+@lru_cache(maxsize=256)
+def _engine_for(parameters: Optional[tuple], enable_fuzzing: bool) -> SchedulingEngine:
+    return SchedulingEngine(parameters, enable_fuzzing=enable_fuzzing)
+
+def get_engine(parameters: Optional[Sequence[float]] = None, enable_fuzzing: bool = True) -> SchedulingEngine:
+    """Process-wide engine for a parameter set (default FSRS weights when None)."""
+    return _engine_for(tuple(parameters) if parameters is not None else None, enable_fuzzing)
+
+def fsrs_schedule(card: Card, rating: Rating, review_datetime: Optional[datetime] = None) -> Card:
+    return get_engine().review(card, rating, review_datetime)
+
+def load_user_parameters(db, user_id: int) -> Optional[Tuple[float, ...]]:
+    row = db.get(UserFSRSParams, user_id)
+    return tuple(json.loads(row.parameters)) if row else None
+
+def get_user_engine(db, user_id: int) -> SchedulingEngine:
+    """Engine with the user's fitted parameters, falling back to the defaults."""
+    return get_engine(load_user_parameters(db, user_id))
+
+async def get_user_engine_async(db, user_id: int) -> SchedulingEngine:
+    row = await db.get(UserFSRSParams, user_id)
+    return get_engine(tuple(json.loads(row.parameters)) if row else None)
+
+def iter_user_reviews(
+    bind,
+    chunk_size: int = 10000,
+    user_ids: Optional[Sequence[int]] = None,
+    since: Optional[datetime] = None,
+) -> Iterator[Tuple[int, List[tuple]]]:
+    """
+    Stream the review log grouped by user, oldest review first.
+
+    Rows are read through a server-side cursor ``chunk_size`` at a time, so
+    memory is bounded by one chunk plus one user's history. ``since`` keeps
+    only users with a review at or after that time (their full history is
+    still yielded). Yields ``(user_id, [(item_id, rating, reviewed_at, response_ms), ...])``.
+    """
+    stmt = (
+        select(Review.user_id, Review.item_id, Review.rating, Review.reviewed_at, Review.response_ms)
+        .order_by(Review.user_id, Review.reviewed_at, Review.id)
+    )
+    if user_ids:
+        stmt = stmt.where(Review.user_id.in_(list(user_ids)))
+    if since is not None:
+        stmt = stmt.where(Review.user_id.in_(select(Review.user_id).where(Review.reviewed_at >= since).distinct()))
 
-def fsrs_schedule(card: Card, rating: Rating) -> Card:
-    scheduler = Scheduler()
-    card, review_log = scheduler.review_card(card, rating)
-    return card
+    with bind.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=chunk_size).execute(stmt)
+        current, rows = None, []
+        for partition in result.partitions():
+            for user_id, item_id, rating, reviewed_at, response_ms in partition:
+                if user_id != current:
+                    if rows:
+                        yield current, rows
+                    current, rows = user_id, []
+                rows.append((item_id, rating, reviewed_at, response_ms))
+        if rows:
+            yield current, rows
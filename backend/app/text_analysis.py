@@ -0,0 +1,166 @@
+"""
+Text analysis for reading items.
+
+Tokenisation is deliberately simple: lower-cased word forms stand in for
+lemmas (there is no German lemmatiser in the stack). Each reading is stored
+as two aligned uint32 arrays -- its sorted distinct lemma ids and their
+counts -- and LemmaIndex packs all of them into one CSR-style structure so
+that vocabulary coverage for every reading is a couple of array operations.
+"""
+
+import re
+import csv
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+WORD_RE = re.compile(r"[^\W\d_]+(?:-[^\W\d_]+)*")
+SENTENCE_RE = re.compile(r"[^.!?]+")
+
+# Bump when text_features() changes so the feature pipeline recomputes everything.
+FEATURES_VERSION = 1
+# Rank cut-offs for the frequency bands (top 100 words, top 250, top 500, rest).
+BAND_EDGES = (100, 250, 500)
+BAND_NAMES = ("top100", "top250", "top500", "off_list")
+SUBORDINATORS = frozenset(
+    "dass weil obwohl damit indem wenn ob nachdem bevor während falls sodass seitdem".split()
+)
+
+# Function words count as known for everyone; without them no text would reach
+# the coverage targets before a learner had drilled "der", "und", "ist", ...
+FUNCTION_WORDS = frozenset("""
+der die das den dem des ein eine einen einem einer eines kein keine keinen keinem keiner
+ich du er sie es wir ihr mich dich sich uns euch mir dir ihm ihn ihnen mein dein sein unser
+und oder aber denn doch sondern nicht nur auch noch schon so wie als ja nein
+in im an am auf aus bei mit nach von vom zu zum zur für über unter vor hinter neben zwischen durch um bis ohne gegen
+ist bin bist sind seid war waren hat habe hast haben hatte wird werden wurde kann
+hier da dort was wer wo wann warum dann jetzt heute sehr mehr viel
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    return [w.lower() for w in WORD_RE.findall(text or "")]
+
+
+def lemma_counts(text: str) -> Counter:
+    return Counter(tokenize(text))
+
+
+def load_frequency_bands(path: str) -> Dict[str, int]:
+    """
+    Word -> band index from collocations_extracted.csv.
+
+    Each word is weighted by the summed frequency of the collocations it
+    appears in; words are then ranked and cut at BAND_EDGES.
+    """
+    weight: Counter = Counter()
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            for word in set(tokenize(row["german"])):
+                weight[word] += int(row["frequency"] or 0)
+    ranked = [w for w, _ in weight.most_common()]
+    return {w: next((b for b, edge in enumerate(BAND_EDGES) if rank < edge), len(BAND_EDGES)) for rank, w in enumerate(ranked)}
+
+
+def text_features(text: str, bands: Dict[str, int]) -> dict:
+    """Lexical statistics for one reading (stored as ReadingItem.features_json)."""
+    words = tokenize(text)
+    sentences = [n for n in (len(WORD_RE.findall(s)) for s in SENTENCE_RE.findall(text or "")) if n]
+    n = len(words)
+    band_counts = Counter(bands.get(w, len(BAND_EDGES)) for w in words)
+    subordinate = sum(1 for w in words if w in SUBORDINATORS)
+    return {
+        "version": FEATURES_VERSION,
+        "tokens": n,
+        "types": len(set(words)),
+        "type_token_ratio": round(len(set(words)) / n, 4) if n else 0.0,
+        "sentences": len(sentences),
+        "mean_sentence_length": round(n / len(sentences), 2) if sentences else 0.0,
+        "max_sentence_length": max(sentences, default=0),
+        "subordinate_markers": subordinate,
+        "subordinate_per_sentence": round(subordinate / len(sentences), 3) if sentences else 0.0,
+        "band_coverage": {name: round(band_counts[b] / n, 4) if n else 0.0 for b, name in enumerate(BAND_NAMES)},
+    }
+
+
+def pack(ids: Sequence[int], counts: Sequence[int]) -> Tuple[bytes, bytes]:
+    """Encode a reading's lemma ids/counts as sorted little-endian uint32 blobs."""
+    ids_arr = np.asarray(ids, dtype="<u4")
+    order = np.argsort(ids_arr, kind="stable")
+    return ids_arr[order].tobytes(), np.asarray(counts, dtype="<u4")[order].tobytes()
+
+
+def unpack(blob: Optional[bytes]) -> np.ndarray:
+    return np.frombuffer(blob or b"", dtype="<u4")
+
+
+class LemmaIndex:
+    """
+    Append-only CSR index of reading -> (lemma ids, counts).
+
+    ``coverage(known)`` returns, for every indexed reading, the share of its
+    running tokens whose lemma is in ``known`` (a boolean mask indexed by
+    lemma id).
+    """
+
+    def __init__(self):
+        self.item_ids = np.zeros(0, dtype=np.int64)
+        self.cefr = np.zeros(0, dtype=object)
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.lemmas = np.zeros(0, dtype=np.intp)  # widened from uint32: native index dtype gathers ~2x faster
+        self.counts = np.zeros(0, dtype=np.float32)
+        self.totals = np.zeros(0, dtype=np.float32)
+        self.row_of: Dict[int, int] = {}
+
+    @property
+    def last_id(self) -> int:
+        return int(self.item_ids[-1]) if self.item_ids.size else 0
+
+    @property
+    def max_lemma(self) -> int:
+        return int(self.lemmas.max()) if self.lemmas.size else 0
+
+    def extend(self, rows: Iterable[Tuple[int, str, bytes, bytes]]) -> int:
+        """Append ``(item_id, cefr, lemma_ids_blob, lemma_counts_blob)`` rows in id order."""
+        ids, cefr, lemmas, counts = [], [], [], []
+        for item_id, level, ids_blob, counts_blob in rows:
+            if not ids_blob:
+                continue  # nothing to cover; also keeps every CSR row non-empty for reduceat
+            ids.append(item_id)
+            cefr.append(level)
+            lemmas.append(unpack(ids_blob))
+            counts.append(unpack(counts_blob))
+        if not ids:
+            return 0
+        lengths = np.fromiter((a.size for a in lemmas), dtype=np.int64, count=len(lemmas))
+        new_counts = np.concatenate(counts).astype(np.float32)
+        start = self.item_ids.size
+        self.row_of.update((item_id, start + n) for n, item_id in enumerate(ids))
+        self.item_ids = np.concatenate([self.item_ids, np.asarray(ids, dtype=np.int64)])
+        self.cefr = np.concatenate([self.cefr, np.asarray(cefr, dtype=object)])
+        self.indptr = np.concatenate([self.indptr, self.indptr[-1] + np.cumsum(lengths)])
+        self.lemmas = np.concatenate([self.lemmas, *lemmas]).astype(np.intp, copy=False)
+        self.counts = np.concatenate([self.counts, new_counts])
+        self.totals = np.concatenate([self.totals, np.add.reduceat(new_counts, np.r_[0, np.cumsum(lengths)[:-1]])])
+        return len(ids)
+
+    def lemmas_of(self, item_id: int) -> np.ndarray:
+        row = self.row_of.get(item_id)
+        if row is None:
+            return np.zeros(0, dtype=np.intp)
+        return self.lemmas[self.indptr[row]:self.indptr[row + 1]]
+
+    def known_mask(self, lemma_ids: Iterable[np.ndarray]) -> np.ndarray:
+        """float32 0/1 mask over lemma ids (a float mask saves a cast in coverage())."""
+        mask = np.zeros(self.max_lemma + 1, dtype=np.float32)
+        for ids in lemma_ids:
+            ids = np.asarray(ids, dtype=np.intp)
+            mask[ids[ids < mask.size]] = 1.0
+        return mask
+
+    def coverage(self, known: np.ndarray) -> np.ndarray:
+        if not self.item_ids.size:
+            return np.zeros(0, dtype=np.float32)
+        covered = np.add.reduceat(known[self.lemmas] * self.counts, self.indptr[:-1])
+        return covered / self.totals
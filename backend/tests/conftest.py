@@ -0,0 +1,44 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The engine is built at import time, so point it at a scratch database first
+DB_PATH = os.path.join(tempfile.mkdtemp(prefix="german-buddy-tests-"), "test.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+os.environ.pop("REDIS_URL", None)
+os.environ.pop("DATABASE_ASYNC", None)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app import cache  # noqa: E402
+from app.database import Base, SessionLocal, User, create_access_token, engine  # noqa: E402
+from app.main import app  # noqa: E402
+
+
+@pytest.fixture
+def db():
+    """A session on empty tables; the process cache is dropped too, since ids are reused."""
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    cache._cache = None
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def client(db):
+    with TestClient(app) as c:
+        yield c
+
+
+@pytest.fixture
+def auth(db):
+    db.add(User(email="learner@example.com", password_hash="x"))
+    db.commit()
+    return {"Authorization": f"Bearer {create_access_token({'sub': 'learner@example.com'})}"}
@@ -0,0 +1,23 @@
+from app.database import Item
+
+
+def test_new_queue_pages_through_null_frequencies(client, db, auth):
+    for n, frequency in enumerate([50, None, 10, None, 0, 30, None]):
+        db.add(Item(german=f"g{n}", english=f"e{n}", frequency=frequency))
+    db.commit()
+    # An explicit NULL, as a bulk import can write, rather than the column default
+    db.query(Item).filter(Item.german.in_(["g1", "g3", "g6"])).update({Item.frequency: None}, synchronize_session=False)
+    db.commit()
+
+    seen, cursor = [], None
+    for _ in range(10):
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        r = client.get("/pwa/exercises", params=params, headers=auth)
+        assert r.status_code == 200, r.text
+        seen += [i["german"] for i in r.json()]
+        cursor = r.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+
+    # Most frequent first, NULL ranked as 0, ties newest id first
+    assert seen == ["g0", "g5", "g2", "g6", "g4", "g3", "g1"]
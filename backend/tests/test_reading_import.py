@@ -0,0 +1,22 @@
+from sqlalchemy import func, select, text
+
+from app.database import engine
+from app.reading import ReadingItem, _compress_legacy_text
+
+STORY = {"cefr": "A1", "title": "Im Park", "text": "Der Hund  spielt im Park."}
+
+
+def test_reimport_skips_upgraded_legacy_rows(client, db, auth):
+    # Two rows as stored before compression and content_hash: plain text, no hash, one a duplicate
+    with engine.begin() as conn:
+        for _ in range(2):
+            conn.execute(text("INSERT INTO reading_items (cefr, title, text, tokens) VALUES ('a1', 'Im Park', 'Der Hund spielt im Park.', 5)"))
+
+    _compress_legacy_text(engine)
+
+    r = client.post("/reading/import", json=[STORY], headers=auth)
+    assert r.json() == {"inserted": 0, "skipped": 1}
+    assert db.execute(select(func.count()).select_from(ReadingItem)).scalar() == 2
+    hashed = db.execute(select(ReadingItem.id).where(ReadingItem.content_hash.isnot(None))).scalars().all()
+    assert hashed == [1]
+    assert client.get("/reading/items/2", headers=auth).json()["text"] == "Der Hund spielt im Park."
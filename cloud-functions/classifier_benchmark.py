@@ -0,0 +1,77 @@
+"""
+Benchmark for the batch sentence classifier
+
+Labels a sentence CSV (sentences_sample.csv by default), optionally repeated
+--scale times to reach corpus size, once per worker count, and reports
+sentences per second plus the resulting level distribution. With --out the
+labelled rows are written back out with a `level` column, ready for
+/srs/items/import (items that carry a level are not reclassified).
+
+Run from this directory:
+
+    python classifier_benchmark.py --scale 12 --workers 1 4
+    python classifier_benchmark.py --out sentences_labelled.csv --json
+"""
+
+import os
+import csv
+import json
+import time
+import argparse
+import statistics
+from collections import Counter
+
+from proficiency_classifier import LEVELS, classify_sentences
+
+DEFAULT_CSV = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'GermanDB', 'output', 'sentences_sample.csv'))
+
+def main():
+    parser = argparse.ArgumentParser(description='Time classify_sentences over a sentence corpus')
+    parser.add_argument('--csv', default=DEFAULT_CSV)
+    parser.add_argument('--column', default='german')
+    parser.add_argument('--scale', type=int, default=10, help='repeat the corpus this many times')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, os.cpu_count() or 1])
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--out', default=None, help='write the (unscaled) rows with a level column here')
+    parser.add_argument('--json', action='store_true', help='print a JSON summary')
+    args = parser.parse_args()
+
+    with open(args.csv, newline='', encoding='utf-8') as f:
+        rows = list(csv.DictReader(f))
+    texts = [row[args.column] for row in rows] * args.scale
+
+    summary = {'sentences': len(texts), 'cpus': os.cpu_count(), 'workers': {}}
+    for workers in dict.fromkeys(args.workers):
+        times = []
+        for _ in range(args.runs):
+            t0 = time.perf_counter()
+            labels = classify_sentences(texts, workers=workers)
+            times.append(time.perf_counter() - t0)
+        best = min(times)
+        summary['workers'][workers] = {
+            'median_s': round(statistics.median(times), 3),
+            'best_s': round(best, 3),
+            'sentences_per_s': round(len(texts) / best),
+        }
+    counts = Counter(labels[:len(rows)])
+    summary['levels'] = {level: counts[level] for level in LEVELS}
+
+    if args.out:
+        with open(args.out, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]) + ['level'] if rows else ['level'])
+            writer.writeheader()
+            for row, level in zip(rows, labels):
+                writer.writerow({**row, 'level': level})
+
+    if args.json:
+        print(json.dumps(summary, indent=2))
+        return
+    print(f"{len(texts)} sentences ({len(rows)} x {args.scale}), {os.cpu_count()} CPUs")
+    for workers, r in summary['workers'].items():
+        print(f"  workers={workers:<3} median {r['median_s']:7.3f} s   best {r['best_s']:7.3f} s   {r['sentences_per_s']:>9} sentences/s")
+    print('  levels: ' + '  '.join(f"{level} {n}" for level, n in summary['levels'].items()))
+    if args.out:
+        print(f"  wrote {args.out}")
+
+if __name__ == '__main__':
+    main()
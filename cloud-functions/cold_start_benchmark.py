@@ -0,0 +1,85 @@
+"""
+Cold-start benchmark for the Cloud Function entry point
+
+Each run starts a fresh interpreter, the way a new instance does, and times
+three phases separately:
+
+    framework      importing functions_framework + flask (paid by the runtime)
+    import         importing main
+    first_request  the first call to german_buddy_api (lazy init included)
+
+Run from this directory; use --json to record the numbers per release:
+
+    python cold_start_benchmark.py --runs 20 --path /health
+    python cold_start_benchmark.py --json > cold_start.json
+"""
+
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+CHILD = r'''
+import json, sys, time
+t0 = time.perf_counter()
+import functions_framework, flask
+t1 = time.perf_counter()
+import main
+t2 = time.perf_counter()
+app = flask.Flask("bench")
+with app.test_request_context(sys.argv[1], method=sys.argv[2]):
+    main.german_buddy_api(flask.request)
+t3 = time.perf_counter()
+print(json.dumps({"framework": t1 - t0, "import": t2 - t1, "first_request": t3 - t2}))
+'''
+
+PHASES = ('framework', 'import', 'first_request')
+
+def run_once(path: str, method: str, env: dict) -> dict:
+    out = subprocess.run(
+        [sys.executable, '-c', CHILD, path, method],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env, capture_output=True, text=True, check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure import + first-request latency of a fresh instance')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--path', default='/health')
+    parser.add_argument('--method', default='GET')
+    parser.add_argument('--state-dir', default=None, help='benchmark recovery from this STATE_DIR')
+    parser.add_argument('--json', action='store_true', help='print a JSON summary')
+    args = parser.parse_args()
+
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE='1')
+    env.pop('STATE_DIR', None)
+    if args.state_dir:
+        env['STATE_DIR'] = args.state_dir
+
+    run_once(args.path, args.method, env)  # warm the OS file cache and .pyc files
+    runs = [run_once(args.path, args.method, env) for _ in range(args.runs)]
+    for r in runs:
+        r['total'] = r['import'] + r['first_request']
+
+    summary = {
+        phase: {
+            'median_ms': round(statistics.median(r[phase] for r in runs) * 1000, 2),
+            'max_ms': round(max(r[phase] for r in runs) * 1000, 2),
+        }
+        for phase in PHASES + ('total',)
+    }
+    summary['runs'] = args.runs
+    summary['path'] = args.path
+
+    if args.json:
+        print(json.dumps(summary, indent=2))
+        return
+    print(f"{args.runs} cold starts, {args.method} {args.path}")
+    for phase in PHASES + ('total',):
+        print(f"  {phase:<14} median {summary[phase]['median_ms']:8.2f} ms   max {summary[phase]['max_ms']:8.2f} ms")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Indexed in-memory item catalog for the Cloud Function backend
+"""
+
+import threading
+from bisect import insort
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+LEVELS = ['A1', 'A2', 'B1', 'B2', 'C1', 'C2']
+
+class ItemStore:
+    """
+    Item catalog with an id index and per-level frequency order.
+
+    Each level keeps a list of (-frequency, id) keys sorted most frequent
+    first, so the top-N query walks only N entries (plus any it has to skip)
+    instead of filtering and sorting the whole catalog. Level counts are
+    maintained on insert. All methods are safe to call from concurrent
+    request threads.
+    """
+
+    def __init__(self, items: Iterable[Dict[str, Any]] = (), classify: Optional[Callable[[dict], str]] = None):
+        self._lock = threading.RLock()
+        self._classify = classify
+        self._by_id: Dict[Any, Dict[str, Any]] = {}
+        self._order: List[tuple] = []
+        self._by_level: Dict[str, List[tuple]] = {}
+        self._counts: Dict[str, int] = {}
+        self.add_many(items)
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def __contains__(self, item_id) -> bool:
+        return item_id in self._by_id
+
+    def get(self, item_id) -> Optional[Dict[str, Any]]:
+        return self._by_id.get(item_id)
+
+    def _prepare(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        if not item.get('level') and self._classify:
+            item = {**item, 'level': self._classify(item)}
+        return item
+
+    @staticmethod
+    def _key(item: Dict[str, Any]) -> tuple:
+        """Sort key; raises KeyError/TypeError for a missing or unhashable id or a non-numeric frequency."""
+        key = (-(item.get('frequency') or 0), item['id'])
+        hash(key)
+        return key
+
+    def add(self, item: Dict[str, Any]) -> bool:
+        """Insert one item; returns False if its id is already present."""
+        item = self._prepare(item)
+        key = self._key(item)
+        with self._lock:
+            if item['id'] in self._by_id:
+                return False
+            self._by_id[item['id']] = item
+            insort(self._order, key)
+            insort(self._by_level.setdefault(item.get('level'), []), key)
+            self._counts[item.get('level')] = self._counts.get(item.get('level'), 0) + 1
+            return True
+
+    def add_many(self, items: Iterable[Dict[str, Any]]) -> int:
+        """
+        Insert items whose id is new (first occurrence wins); returns how many
+        were added. Every key is computed before anything is stored, so an
+        invalid item raises with the store unchanged.
+        """
+        keyed = [(item, self._key(item)) for item in map(self._prepare, items)]
+        with self._lock:
+            added: Dict[str, List[tuple]] = {}
+            for item, key in keyed:
+                if item['id'] in self._by_id:
+                    continue
+                self._by_id[item['id']] = item
+                added.setdefault(item.get('level'), []).append(key)
+            # Append and re-sort: Timsort merges the new run in O(n + k log k),
+            # where insort per item would be O(n * k) for a large import.
+            for level, keys in added.items():
+                self._by_level.setdefault(level, []).extend(keys)
+                self._by_level[level].sort()
+                self._order.extend(keys)
+                self._counts[level] = self._counts.get(level, 0) + len(keys)
+            if added:
+                self._order.sort()
+            return sum(len(keys) for keys in added.values())
+
+    def top(self, limit: int, level: Optional[str] = None, exclude: Iterable = ()) -> List[Dict[str, Any]]:
+        """Most frequent items first, optionally for one level, skipping ids in ``exclude``."""
+        exclude = set(exclude)
+        out = []
+        with self._lock:
+            keys = self._order if level is None else self._by_level.get(level, [])
+            for _, item_id in keys:
+                if len(out) >= limit:
+                    break
+                if item_id not in exclude:
+                    out.append(self._by_id[item_id])
+        return out
+
+    def level_counts(self) -> Dict[str, int]:
+        with self._lock:
+            return {level: self._counts.get(level, 0) for level in LEVELS}
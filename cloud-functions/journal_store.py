@@ -0,0 +1,281 @@
+"""
+Durable state for the Cloud Function backend: an append-only journal with
+group commit and periodic snapshots
+"""
+
+import os
+import json
+import glob
+import pickle
+import time
+import queue
+import atexit
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from progress_store import DailyProgressStore
+from review_log import ReviewLog
+
+logger = logging.getLogger(__name__)
+
+# Fields of a review record before ReviewLog; still read from old journals/snapshots
+REVIEW_FIELDS = ('user_email', 'item_id', 'rating', 'timestamp', 'stability', 'difficulty', 'due', 'last_reviewed')
+
+class AppState:
+    """
+    All mutable backend state. Every change goes through ``apply`` so that
+    replaying the journal reproduces it exactly.
+    """
+
+    def __init__(self, spill_dir: Optional[str] = None):
+        self.users: Dict[str, Dict[str, Any]] = {}
+        self.reviews = ReviewLog(spill_dir)
+        self.user_srs: Dict[str, Dict[Any, Dict[str, Any]]] = {}
+        self.daily_progress = DailyProgressStore()
+
+    def apply(self, op: str, args: list) -> None:
+        if op == 'user':
+            email, record = args
+            self.users[email] = record
+        elif op == 'review':
+            if len(args) == len(REVIEW_FIELDS):
+                args = _legacy_review(args)
+            self.reviews.append(*args)
+        elif op == 'srs':
+            email, item_id, data = args
+            self.user_srs.setdefault(email, {})[item_id] = data
+        elif op == 'learned':
+            email, day, item_id = args
+            self.daily_progress.add(email, day, item_id)
+        else:
+            raise ValueError(f"Unknown journal op: {op}")
+
+    def copy(self) -> Dict[str, Any]:
+        """Point-in-time copy, deep enough that later applies cannot change it."""
+        return {
+            'users': dict(self.users),
+            'reviews': self.reviews.copy(),
+            'user_srs': {email: dict(items) for email, items in self.user_srs.items()},
+            'daily_progress': self.daily_progress.copy(),
+        }
+
+    def restore(self, data: Dict[str, Any]) -> None:
+        self.users = data['users']
+        if isinstance(data['reviews'], list):  # snapshot written before ReviewLog
+            for review in data['reviews']:
+                self.reviews.append(*_legacy_review(review))
+        else:
+            self.reviews = data['reviews']
+        self.user_srs = data['user_srs']
+        self.daily_progress = data['daily_progress']
+        if isinstance(self.daily_progress, dict):  # snapshot written before DailyProgressStore
+            self.daily_progress = DailyProgressStore.from_nested(self.daily_progress)
+
+def _legacy_review(review) -> tuple:
+    """(email, item_id, rating, epoch seconds) from a REVIEW_FIELDS record."""
+    email, item_id, rating, timestamp = review[:4]
+    ts = datetime.fromisoformat(timestamp)
+    if ts.tzinfo is None:  # written with datetime.utcnow()
+        ts = ts.replace(tzinfo=timezone.utc)
+    return email, int(item_id), int(rating), int(ts.timestamp())
+
+class MemoryStore:
+    """Process-local state only; the default when no state directory is configured."""
+
+    def __init__(self, spill_dir: Optional[str] = None):
+        self.state = AppState(spill_dir)
+        self._lock = threading.Lock()
+
+    def open(self) -> 'MemoryStore':
+        return self
+
+    def append(self, op: str, *args) -> None:
+        with self._lock:
+            self.state.apply(op, list(args))
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+class JournalStore(MemoryStore):
+    """
+    State persisted as snapshots plus an append-only JSON-lines journal.
+
+    ``append`` applies a change in memory and queues it; a writer thread
+    writes everything queued within ``group_commit_ms`` with one write and
+    one fsync, so requests never wait on the disk (a crash can lose at most
+    that window). Every ``snapshot_every`` records the journal is rotated to
+    a new segment and a snapshot of the state as of the rotation is written
+    in the background; older segments and snapshots are then deleted.
+    Recovery loads the newest snapshot and replays only the segments after
+    it, ignoring a torn final line.
+
+    Files in ``directory``: ``snapshot-<seq>.pkl`` holds the state before
+    ``journal-<seq>.log``; segments are numbered consecutively. Review
+    segments spilled by ReviewLog live in ``reviews/``.
+    """
+
+    def __init__(self, directory: str, group_commit_ms: float = 20, snapshot_every: int = 50_000, fsync: bool = True):
+        super().__init__(os.path.join(directory, 'reviews'))
+        self.directory = directory
+        self.group_commit = group_commit_ms / 1000
+        self.snapshot_every = snapshot_every
+        self.fsync = fsync
+        self._queue: 'queue.Queue' = queue.Queue()
+        self._since_snapshot = 0
+        self._snapshotting = False
+        self._seq = 0
+        self._writer: Optional[threading.Thread] = None
+
+    def _path(self, kind: str, seq: int) -> str:
+        ext = 'pkl' if kind == 'snapshot' else 'log'
+        return os.path.join(self.directory, f"{kind}-{seq:08d}.{ext}")
+
+    def _seqs(self, kind: str) -> List[int]:
+        return sorted(int(os.path.basename(p).split('-')[1].split('.')[0]) for p in glob.glob(os.path.join(self.directory, f"{kind}-*")) if not p.endswith('.tmp'))
+
+    def open(self) -> 'JournalStore':
+        os.makedirs(self.directory, exist_ok=True)
+        base, replayed = 0, 0
+        for seq in reversed(self._seqs('snapshot')):
+            try:
+                with open(self._path('snapshot', seq), 'rb') as f:
+                    self.state.restore(pickle.load(f))
+                base = seq
+                break
+            except (OSError, pickle.UnpicklingError, EOFError) as e:
+                logger.warning(f"Skipping unreadable snapshot {seq}: {e}")
+        segments = [s for s in self._seqs('journal') if s >= base]
+        for seq in segments:
+            replayed += self._replay(self._path('journal', seq))
+        # Never append to a segment that may end in a torn line
+        self._seq = max(segments + [base - 1]) + 1
+        self._since_snapshot = replayed
+        self._writer = threading.Thread(target=self._write_loop, args=(self._seq,), name='journal-writer', daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+        logger.info(f"Recovered state from snapshot {base} plus {replayed} journal records")
+        return self
+
+    def _replay(self, path: str) -> int:
+        count = 0
+        with open(path, 'rb') as f:
+            for line in f:
+                try:
+                    if not line.endswith(b'\n'):
+                        raise ValueError('incomplete line')
+                    op, args = json.loads(line)
+                except ValueError:
+                    logger.warning(f"Ignoring torn journal record at the end of {path}")
+                    break
+                self.state.apply(op, args)
+                count += 1
+        return count
+
+    def append(self, op: str, *args) -> None:
+        line = json.dumps([op, args], separators=(',', ':'), default=str) + '\n'
+        with self._lock:
+            self.state.apply(op, list(args))
+            self._queue.put(line)
+            self._since_snapshot += 1
+            if self._since_snapshot >= self.snapshot_every and not self._snapshotting:
+                self._start_snapshot()
+
+    def _start_snapshot(self) -> None:
+        # Called under self._lock: the copy and the rotation marker agree exactly.
+        self._snapshotting = True
+        self._since_snapshot = 0
+        self._seq += 1
+        self._queue.put(('rotate', self._seq))
+        data = self.state.copy()
+        threading.Thread(target=self._write_snapshot, args=(self._seq, data), name='journal-snapshot', daemon=True).start()
+
+    def snapshot(self) -> None:
+        with self._lock:
+            if not self._snapshotting:
+                self._start_snapshot()
+
+    def _write_snapshot(self, seq: int, data: Dict[str, Any]) -> None:
+        path = self._path('snapshot', seq)
+        try:
+            with open(path + '.tmp', 'wb') as f:
+                pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(path + '.tmp', path)
+            for old in self._seqs('snapshot'):
+                if old < seq:
+                    os.remove(self._path('snapshot', old))
+            for old in self._seqs('journal'):
+                if old < seq:
+                    os.remove(self._path('journal', old))
+        except OSError as e:
+            logger.error(f"Snapshot {seq} failed: {e}")
+        finally:
+            self._snapshotting = False
+
+    def _write_loop(self, seq: int) -> None:
+        f = open(self._path('journal', seq), 'ab')
+        stop = False
+        while not stop:
+            batch = [self._queue.get()]
+            if batch[0] is not None:
+                time.sleep(self.group_commit)  # group commit: let concurrent appends pile up
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                f, stop = self._write_batch(f, batch)
+            except OSError as e:
+                logger.error(f"Journal write failed, {len(batch)} records not persisted: {e}")
+            for _ in batch:
+                self._queue.task_done()
+        f.close()
+
+    def _write_batch(self, f, batch: list):
+        stop, lines = False, []
+        for entry in batch:
+            if isinstance(entry, str):
+                lines.append(entry)
+                continue
+            f.write(''.join(lines).encode('utf-8'))
+            lines = []
+            if entry is None:
+                stop = True
+            elif entry[0] == 'rotate':
+                self._sync(f)
+                f.close()
+                f = open(self._path('journal', entry[1]), 'ab')
+            elif entry[0] == 'flush':
+                self._sync(f)
+                entry[1].set()
+        f.write(''.join(lines).encode('utf-8'))
+        self._sync(f)
+        return f, stop
+
+    def _sync(self, f) -> None:
+        f.flush()
+        if self.fsync:
+            os.fsync(f.fileno())
+
+    def flush(self) -> None:
+        """Block until everything appended so far is on disk."""
+        if self._writer and self._writer.is_alive():
+            done = threading.Event()
+            self._queue.put(('flush', done))
+            done.wait()
+
+    def close(self) -> None:
+        if self._writer and self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join()
+
+def open_store(directory: Optional[str] = None, **kwargs) -> MemoryStore:
+    """JournalStore under ``directory``, or a MemoryStore when it is empty/None."""
+    return (JournalStore(directory, **kwargs) if directory else MemoryStore()).open()
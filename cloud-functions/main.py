@@ -4,13 +4,18 @@ German Buddy - Cloud Functions Backend
 
 import os
 import json
+import time
 import logging
+import threading
 from datetime import datetime, timedelta
 from typing import Dict, Any, List, Optional
 import hashlib
-import jwt
+# jwt and journal_store are imported where they are first needed: they are the
+# heaviest imports we own, and /health and /proficiency/levels never need jwt
 # from fsrs import Scheduler, Card, Rating  # Temporarily disabled for deployment
 from proficiency_classifier import get_proficiency_level
+from item_store import ItemStore
+from review_log import MAX_ITEM_ID
 
 # Import Functions Framework
 import functions_framework
@@ -26,12 +31,19 @@ JWT_SECRET = os.environ.get('JWT_SECRET', 'dev-secret-key-change-in-production')
 JWT_ALGORITHM = 'HS256'
 JWT_EXPIRATION_HOURS = 24 * 7  # 7 days
 
-# In-memory storage for demo (use Cloud SQL or Firestore in production)
-users_db = {}
-reviews_db = []
-items_db = []
-user_srs_db = {}  # user_email -> {item_id -> {stability, difficulty, due, last_reviewed}}
-daily_progress_db = {}  # user_email -> {date -> {learned_items: set, completed: bool}}
+# State directory for the journal/snapshot store; in-memory only when unset
+STATE_DIR = os.environ.get('STATE_DIR', '')
+STATE_SNAPSHOT_EVERY = int(os.environ.get('STATE_SNAPSHOT_EVERY', '50000'))
+
+# User state lives in the store; every change is recorded with store.append().
+# All of these are set up by init_app() on the first request.
+store = None
+users_db = None
+reviews_db = None  # ReviewLog: columnar (user, item_id, rating, epoch seconds)
+items_db = None
+user_srs_db = None  # user_email -> {item_id -> {stability, difficulty, due, last_reviewed}}
+daily_progress_db = None  # DailyProgressStore: (user_email, date) -> learned item ids
+_init_lock = threading.Lock()
 
 # High-frequency German collocations from frequency analysis
 SAMPLE_ITEMS = [
@@ -47,19 +59,28 @@ SAMPLE_ITEMS = [
     {"id": 10, "german": "wir haben", "english": "we have", "frequency": 467, "pattern": "wir_haben", "source": "100k_German_sentences_with_aud"},
 ]
 
-# Add proficiency levels to items
-for item in SAMPLE_ITEMS:
-    item['level'] = get_proficiency_level(item)
-
-def init_sample_data():
-    """Initialize sample data if items_db is empty"""
-    global items_db
-    if not items_db:
-        items_db = SAMPLE_ITEMS.copy()
+def init_app():
+    """One-time initialization: recover user state and load the item catalog"""
+    global store, users_db, reviews_db, items_db, user_srs_db, daily_progress_db
+    if store is not None:
+        return
+    with _init_lock:
+        if store is not None:
+            return
+        from journal_store import open_store
+        state_store = open_store(STATE_DIR, snapshot_every=STATE_SNAPSHOT_EVERY)
+        users_db = state_store.state.users
+        reviews_db = state_store.state.reviews
+        user_srs_db = state_store.state.user_srs
+        daily_progress_db = state_store.state.daily_progress
+        # Levels are assigned by the classifier as items are inserted
+        items_db = ItemStore(SAMPLE_ITEMS, classify=get_proficiency_level)
         logger.info(f"Initialized {len(items_db)} sample German items")
+        store = state_store
 
 def create_jwt_token(user_email: str) -> str:
     """Create JWT token for user"""
+    import jwt
     payload = {
         'email': user_email,
         'exp': datetime.utcnow() + timedelta(hours=JWT_EXPIRATION_HOURS),
@@ -69,6 +90,7 @@ def create_jwt_token(user_email: str) -> str:
 
 def verify_jwt_token(token: str) -> Optional[str]:
     """Verify JWT token and return user email"""
+    import jwt
     try:
         if token.startswith('Bearer '):
             token = token[7:]
@@ -106,53 +128,26 @@ def get_daily_progress(user_email: str) -> Dict[str, Any]:
     """Get user's daily progress"""
     today = get_today_string()
 
-    if user_email not in daily_progress_db:
-        daily_progress_db[user_email] = {}
-
-    if today not in daily_progress_db[user_email]:
-        daily_progress_db[user_email][today] = {
-            'learned_items': set(),
-            'completed': False
-        }
-
-    progress = daily_progress_db[user_email][today]
-    return {
-        'learned_count': len(progress['learned_items']),
-        'target_count': 5,
-        'completed': progress['completed'],
-        'learned_items': list(progress['learned_items'])
-    }
+    return daily_progress_db.progress(user_email, today)
 
 def add_learned_item(user_email: str, item_id: int) -> Dict[str, Any]:
     """Add an item to user's daily learned items"""
     today = get_today_string()
+    was_completed = daily_progress_db.progress(user_email, today)['completed']
 
-    if user_email not in daily_progress_db:
-        daily_progress_db[user_email] = {}
-
-    if today not in daily_progress_db[user_email]:
-        daily_progress_db[user_email][today] = {
-            'learned_items': set(),
-            'completed': False
-        }
+    store.append('learned', user_email, today, item_id)
 
-    progress = daily_progress_db[user_email][today]
-    progress['learned_items'].add(item_id)
-
-    # Check if daily target is reached
-    if len(progress['learned_items']) >= 5:
-        progress['completed'] = True
+    progress = daily_progress_db.progress(user_email, today)
+    if progress['completed'] and not was_completed:
         logger.info(f"User {user_email} completed daily learning target!")
-
-    return get_daily_progress(user_email)
+    return progress
 
 @functions_framework.http
 @cross_origin()
 def german_buddy_api(request: Request) -> Response:
     """Main Cloud Function entry point"""
 
-    # Initialize sample data
-    init_sample_data()
+    init_app()
 
     # Handle preflight OPTIONS requests
     if request.method == 'OPTIONS':
@@ -171,46 +166,36 @@ def german_buddy_api(request: Request) -> Response:
     logger.info(f"Processing {method} {path}")
 
     try:
-        # Route requests
-        if path == '/' or path == '/health':
-            return jsonify({
-                "message": "German Buddy API",
-                "status": "healthy",
-                "timestamp": datetime.utcnow().isoformat(),
-                "items_count": len(items_db)
-            })
-
-        elif path == '/auth/signup' and method == 'POST':
-            return handle_signup(request)
-
-        elif path == '/auth/login' and method == 'POST':
-            return handle_login(request)
-
-        elif path == '/me' and method == 'GET':
-            return handle_me(request)
-
-        elif path == '/pwa/exercises' and method == 'GET':
-            return handle_exercises(request)
-
-        elif path == '/pwa/review' and method == 'POST':
-            return handle_review(request)
-
-        elif path == '/srs/items/import' and method == 'POST':
-            return handle_import_items(request)
-
-        elif path == '/proficiency/levels' and method == 'GET':
-            return handle_proficiency_levels(request)
-
-        elif path == '/daily/progress' and method == 'GET':
-            return handle_daily_progress(request)
-
-        else:
+        # Route requests (health answers any method)
+        handler = ROUTES.get((method, path)) or ROUTES.get((None, path))
+        if handler is None:
             return jsonify({"error": "Not found"}), 404
+        return handler(request)
 
     except Exception as e:
         logger.error(f"Error processing request: {e}")
         return jsonify({"error": "Internal server error"}), 500
 
+def handle_health(request: Request) -> Response:
+    """Handle health check"""
+    return jsonify({
+        "message": "German Buddy API",
+        "status": "healthy",
+        "timestamp": datetime.utcnow().isoformat(),
+        "items_count": len(items_db),
+        "memory": memory_stats()
+    })
+
+def memory_stats() -> Dict[str, Any]:
+    """Footprint of the in-memory stores, plus the process peak RSS where available"""
+    stats = {"daily_progress": daily_progress_db.stats(), "reviews": reviews_db.stats()}
+    try:
+        import resource
+        stats["max_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    except ImportError:
+        pass
+    return stats
+
 def handle_signup(request: Request) -> Response:
     """Handle user signup"""
     data = request.get_json()
@@ -230,12 +215,12 @@ def handle_signup(request: Request) -> Response:
         proficiency_level = 'A1'
 
     # Store user with proficiency level
-    users_db[email] = {
+    store.append('user', email, {
         "email": email,
         "password": hash_password(password),
         "proficiency_level": proficiency_level,
         "created_at": datetime.utcnow().isoformat()
-    }
+    })
 
     # Create token
     token = create_jwt_token(email)
@@ -303,15 +288,6 @@ def handle_exercises(request: Request) -> Response:
     limit = int(request.args.get('limit', 10))
     level = request.args.get('level', None)  # Optional proficiency filter
 
-    # Filter by level if specified
-    filtered_items = items_db
-    if level:
-        filtered_items = [item for item in items_db if item.get('level') == level.upper()]
-
-    # Filter out items already learned today
-    learned_today = set(daily_progress['learned_items'])
-    available_items = [item for item in filtered_items if item['id'] not in learned_today]
-
     # If daily quota is completed, return empty with progress info
     if daily_progress['completed']:
         logger.info(f"User {user_email} has completed daily quota ({daily_progress['learned_count']}/5)")
@@ -321,12 +297,14 @@ def handle_exercises(request: Request) -> Response:
             "message": "Daily learning quota completed! Come back tomorrow for more phrases."
         })
 
-    # Sort by frequency descending (Pareto Principle - highest impact first)
-    sorted_items = sorted(available_items, key=lambda x: x.get('frequency', 0), reverse=True)
-
-    # Limit to remaining items needed for daily quota
-    remaining_needed = 5 - daily_progress['learned_count']
-    result = sorted_items[:min(limit, remaining_needed)]
+    # Highest frequency first (Pareto Principle - highest impact first), skipping
+    # items already learned today, limited to the remaining daily quota
+    remaining_needed = daily_progress['target_count'] - daily_progress['learned_count']
+    result = items_db.top(
+        min(limit, remaining_needed),
+        level=level.upper() if level else None,
+        exclude=daily_progress['learned_items'],
+    )
 
     logger.info(f"Returning {len(result)} exercises for level {level or 'all'}, progress: {daily_progress['learned_count']}/5")
     return jsonify({
@@ -349,6 +327,12 @@ def handle_review(request: Request) -> Response:
     if not item_id or rating is None:
         return jsonify({"error": "item_id and rating required"}), 400
 
+    if not isinstance(item_id, int) or isinstance(item_id, bool):
+        return jsonify({"error": "item_id must be an integer"}), 400
+
+    if not 0 <= item_id <= MAX_ITEM_ID:  # the review log stores ids as uint32
+        return jsonify({"error": f"item_id must be between 0 and {MAX_ITEM_ID}"}), 400
+
     if rating not in [1, 2, 3]:  # Hard, Medium, Easy (traffic light system)
         return jsonify({"error": "rating must be 1-3 (Hard/Medium/Easy)"}), 400
 
@@ -356,15 +340,9 @@ def handle_review(request: Request) -> Response:
     try:
         fsrs_result = simple_schedule(user_email, item_id, rating)
 
-        # Store review
-        review = {
-            "user_email": user_email,
-            "item_id": item_id,
-            "rating": rating,
-            "timestamp": datetime.utcnow().isoformat(),
-            "fsrs_data": fsrs_result
-        }
-        reviews_db.append(review)
+        # Journal the review and the card's new scheduling state (user_srs_db)
+        store.append('review', user_email, item_id, rating, int(time.time()))
+        store.append('srs', user_email, item_id, fsrs_result)
 
         # Add to daily progress only if rating is "Easy" (3)
         daily_progress = None
@@ -390,42 +368,43 @@ def handle_review(request: Request) -> Response:
 
 def handle_proficiency_levels(request: Request) -> Response:
     """Return available proficiency levels and their descriptions"""
+    counts = items_db.level_counts()
     levels = {
         "A1": {
             "name": "Beginner",
             "description": "Can understand and use familiar everyday expressions",
             "frequency_range": "800+",
-            "example_count": sum(1 for item in items_db if item.get('level') == 'A1')
+            "example_count": counts['A1']
         },
         "A2": {
             "name": "Elementary",
             "description": "Can communicate in simple and routine tasks",
             "frequency_range": "500-799",
-            "example_count": sum(1 for item in items_db if item.get('level') == 'A2')
+            "example_count": counts['A2']
         },
         "B1": {
             "name": "Intermediate",
             "description": "Can deal with most situations while traveling",
             "frequency_range": "200-499",
-            "example_count": sum(1 for item in items_db if item.get('level') == 'B1')
+            "example_count": counts['B1']
         },
         "B2": {
             "name": "Upper Intermediate",
             "description": "Can interact with native speakers fluently",
             "frequency_range": "100-199",
-            "example_count": sum(1 for item in items_db if item.get('level') == 'B2')
+            "example_count": counts['B2']
         },
         "C1": {
             "name": "Advanced",
             "description": "Can use language flexibly for social and professional purposes",
             "frequency_range": "50-99",
-            "example_count": sum(1 for item in items_db if item.get('level') == 'C1')
+            "example_count": counts['C1']
         },
         "C2": {
             "name": "Proficient",
             "description": "Can understand virtually everything heard or read",
             "frequency_range": "0-49",
-            "example_count": sum(1 for item in items_db if item.get('level') == 'C2')
+            "example_count": counts['C2']
         }
     }
     return jsonify(levels)
@@ -441,6 +420,31 @@ def handle_daily_progress(request: Request) -> Response:
     daily_progress = get_daily_progress(user_email)
     return jsonify(daily_progress)
 
+def handle_review_summary(request: Request) -> Response:
+    """Review totals per rating and active days for the last ?days= days"""
+    auth_header = request.headers.get('Authorization', '')
+    user_email = verify_jwt_token(auth_header)
+
+    if not user_email:
+        return jsonify({"error": "Invalid or missing token"}), 401
+
+    try:
+        days = int(request.args.get('days', 30))
+    except ValueError:
+        return jsonify({"error": "days must be an integer"}), 400
+    if not 1 <= days <= 3650:
+        return jsonify({"error": "days must be between 1 and 3650"}), 400
+
+    import numpy as np
+    reviews = reviews_db.scan(user_email, since=int(time.time()) - days * 86400)
+    by_rating = np.bincount(reviews['rating'], minlength=4)[1:4]
+    return jsonify({
+        "days": days,
+        "total": int(len(reviews['rating'])),
+        "by_rating": {str(rating): int(count) for rating, count in enumerate(by_rating, start=1)},
+        "active_days": int(len(np.unique(reviews['ts'] // 86400))),
+    })
+
 def handle_import_items(request: Request) -> Response:
     """Handle import items (admin only)"""
     auth_header = request.headers.get('Authorization', '')
@@ -453,14 +457,25 @@ def handle_import_items(request: Request) -> Response:
     if not isinstance(data, list):
         return jsonify({"error": "Expected list of items"}), 400
 
-    # Add items to database
-    inserted = 0
-    for item in data:
-        if all(key in item for key in ['id', 'german', 'english']):
-            # Check if item already exists
-            if not any(existing['id'] == item['id'] for existing in items_db):
-                items_db.append(item)
-                inserted += 1
+    # Add items to database (existing ids are skipped)
+    inserted = items_db.add_many(
+        item for item in data if all(key in item for key in ['id', 'german', 'english'])
+    )
 
     logger.info(f"Imported {inserted} new items")
-    return jsonify({"inserted": inserted, "total": len(items_db)})
\ No newline at end of file
+    return jsonify({"inserted": inserted, "total": len(items_db)})
+
+# (method, path) -> handler; a None method matches any method
+ROUTES = {
+    (None, '/'): handle_health,
+    (None, '/health'): handle_health,
+    ('POST', '/auth/signup'): handle_signup,
+    ('POST', '/auth/login'): handle_login,
+    ('GET', '/me'): handle_me,
+    ('GET', '/pwa/exercises'): handle_exercises,
+    ('POST', '/pwa/review'): handle_review,
+    ('GET', '/reviews/summary'): handle_review_summary,
+    ('POST', '/srs/items/import'): handle_import_items,
+    ('GET', '/proficiency/levels'): handle_proficiency_levels,
+    ('GET', '/daily/progress'): handle_daily_progress,
+}
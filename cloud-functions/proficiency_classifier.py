@@ -1,7 +1,12 @@
 """
-German Proficiency Level Classifier based on frequency and source
+German Proficiency Level Classifier based on frequency and source, plus a
+batch classifier for whole sentence corpora
 """
 
+import os
+import re
+from typing import Dict, List, Optional, Sequence
+
 def classify_proficiency_by_frequency(frequency: int) -> str:
     """
     Classify German proficiency level based on word/phrase frequency.
@@ -70,4 +75,122 @@ def get_proficiency_level(item: dict) -> str:
         return classify_proficiency_by_frequency(frequency)
 
     # Fallback to source-based classification
-    return classify_by_source(source)
\ No newline at end of file
+    return classify_by_source(source)
+
+# --- Batch classification of sentence corpora -------------------------------
+
+WORD_RE = re.compile(r"[^\W\d_]+")
+
+# The markers curate_srs.mjs's isComplex() looks for, matched as whole words
+SUBORDINATORS = frozenset(['dass', 'weil', 'obwohl', 'damit', 'indem'])
+KONJUNKTIV = frozenset(
+    stem + ending
+    for stem in ['würde', 'hätte', 'wäre', 'könnte', 'sollte', 'müsste', 'dürfte']
+    for ending in ['', 'n', 'st', 't']
+)
+
+RARE_RANK = 2000  # words outside the most frequent 2000 count as rare
+
+# score = FEATURE_WEIGHTS . features; LEVEL_EDGES split it into A1..C2
+SENTENCE_FEATURES = ('log_words', 'mean_log_rank', 'rare_share', 'mean_word_len', 'subordinators', 'konjunktiv', 'commas')
+FEATURE_WEIGHTS = (1.0, 0.3, 2.0, 0.15, 0.6, 0.6, 0.25)
+LEVEL_EDGES = (6.0, 6.4, 6.8, 7.2, 7.7)
+LEVELS = ('A1', 'A2', 'B1', 'B2', 'C1', 'C2')
+
+PARALLEL_MIN = 20_000  # below this the pool costs more than it saves
+CHUNK_SIZE = 10_000
+
+def _tokenize_chunk(texts: List[str]):
+    """
+    Worker: one regex pass per sentence. Returns the chunk's vocabulary, the
+    flat token ids into it, and per-sentence token/marker/comma counts.
+    """
+    import numpy as np
+
+    vocab: Dict[str, int] = {}
+    ids: List[int] = []
+    counts = np.zeros((len(texts), 4), dtype=np.int32)  # tokens, subordinators, konjunktiv, commas
+    for row, text in enumerate(texts):
+        words = WORD_RE.findall(text.lower())
+        ids.extend(vocab.setdefault(w, len(vocab)) for w in words)
+        counts[row] = (
+            len(words),
+            sum(w in SUBORDINATORS for w in words),
+            sum(w in KONJUNKTIV for w in words),
+            text.count(','),
+        )
+    return list(vocab), np.array(ids, dtype=np.int32), counts
+
+def sentence_features(texts: Sequence[str], ranks: Optional[Dict[str, int]] = None, workers: Optional[int] = None):
+    """
+    Feature matrix (float32, one row per text, columns SENTENCE_FEATURES).
+
+    Tokenizing is the only per-sentence Python work and is spread over
+    ``workers`` processes for large inputs; everything else runs as array
+    operations over the whole corpus. Word ranks come from ``ranks`` (1 =
+    most frequent) or, when None, from word frequencies in ``texts`` itself.
+    """
+    import numpy as np
+
+    texts = [t or '' for t in texts]
+    chunks = [texts[i:i + CHUNK_SIZE] for i in range(0, len(texts), CHUNK_SIZE)]
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(texts) >= PARALLEL_MIN:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(workers) as pool:
+            parts = list(pool.map(_tokenize_chunk, chunks))
+    else:
+        parts = [_tokenize_chunk(chunk) for chunk in chunks]
+
+    # Merge the chunk vocabularies into one and remap token ids onto it
+    vocab: Dict[str, int] = {}
+    token_ids = []
+    for words, ids, _ in parts:
+        remap = np.array([vocab.setdefault(w, len(vocab)) for w in words], dtype=np.int32)
+        token_ids.append(remap[ids] if len(ids) else ids)
+    token_ids = np.concatenate(token_ids) if token_ids else np.zeros(0, dtype=np.int32)
+    counts = np.concatenate([c for _, _, c in parts]) if parts else np.zeros((0, 4), dtype=np.int32)
+    words = list(vocab)
+
+    if ranks is None:
+        order = np.argsort(-np.bincount(token_ids, minlength=len(words)), kind='stable')
+        word_rank = np.empty(len(words), dtype=np.float32)
+        word_rank[order] = np.arange(1, len(words) + 1)
+    else:
+        unseen = max(ranks.values(), default=0) + 1
+        word_rank = np.array([ranks.get(w, unseen) for w in words], dtype=np.float32)
+    word_len = np.array([len(w) for w in words], dtype=np.float32)
+
+    n_tokens = counts[:, 0]
+    has_tokens = n_tokens > 0
+    starts = (np.cumsum(n_tokens) - n_tokens)[has_tokens]
+    n = n_tokens[has_tokens].astype(np.float32)
+
+    def per_sentence_mean(values):
+        out = np.zeros(len(texts), dtype=np.float32)
+        if len(values):
+            out[has_tokens] = np.add.reduceat(values, starts) / n
+        return out
+
+    tok_rank = word_rank[token_ids]
+    features = np.column_stack([
+        np.log2(1 + n_tokens),
+        per_sentence_mean(np.log2(tok_rank)),
+        per_sentence_mean((tok_rank > RARE_RANK).astype(np.float32)),
+        per_sentence_mean(word_len[token_ids]),
+        counts[:, 1],
+        counts[:, 2],
+        counts[:, 3],
+    ]).astype(np.float32)
+    return features
+
+def classify_sentences(texts: Sequence[str], ranks: Optional[Dict[str, int]] = None, workers: Optional[int] = None) -> List[str]:
+    """
+    CEFR level per sentence from lexical features: length, word frequency
+    ranks, rare-word share, word length, and subordinate-clause, Konjunktiv
+    and comma counts. See sentence_features for ``ranks`` and ``workers``.
+    """
+    import numpy as np
+
+    scores = sentence_features(texts, ranks, workers) @ np.array(FEATURE_WEIGHTS, dtype=np.float32)
+    return [LEVELS[i] for i in np.digitize(scores, LEVEL_EDGES)]
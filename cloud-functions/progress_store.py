@@ -0,0 +1,105 @@
+"""
+Compact daily-progress store with a retention window
+"""
+
+import os
+import sys
+import threading
+from array import array
+from datetime import date
+from typing import Any, Dict, List
+
+DAILY_TARGET = 5
+DAILY_RETENTION_DAYS = int(os.environ.get('DAILY_RETENTION_DAYS', '7'))
+
+class DailyProgressStore:
+    """
+    Items learned per user per day.
+
+    Days are bucketed by ordinal, and each user's items for a day are a
+    small unsigned-int array instead of a set inside a nested dict, so an
+    active user-day costs roughly a hundred bytes. Only the newest
+    ``retention_days`` days are kept: whenever a newer day is first written,
+    whole older buckets are dropped. Eviction follows the data rather than
+    the wall clock, so replaying a journal gives the same result.
+    """
+
+    def __init__(self, retention_days: int = DAILY_RETENTION_DAYS, target: int = DAILY_TARGET):
+        self.retention_days = retention_days
+        self.target = target
+        self._days: Dict[int, Dict[str, array]] = {}
+        self._newest = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _ordinal(day: str) -> int:
+        return date.fromisoformat(day).toordinal()
+
+    def add(self, user: str, day: str, item_id: int) -> None:
+        ordinal, item_id = self._ordinal(day), int(item_id)
+        with self._lock:
+            if ordinal > self._newest:
+                self._newest = ordinal
+                self._evict()
+            elif ordinal <= self._newest - self.retention_days:
+                return  # already outside the window
+            items = self._days.setdefault(ordinal, {}).setdefault(user, array('I'))
+            if item_id not in items:
+                items.append(item_id)
+
+    def _evict(self) -> int:
+        cutoff = self._newest - self.retention_days
+        old = [d for d in self._days if d <= cutoff]
+        for d in old:
+            del self._days[d]
+        return len(old)
+
+    def learned(self, user: str, day: str) -> List[int]:
+        items = self._days.get(self._ordinal(day), {}).get(user)
+        return items.tolist() if items is not None else []
+
+    def progress(self, user: str, day: str) -> Dict[str, Any]:
+        learned = self.learned(user, day)
+        return {
+            'learned_count': len(learned),
+            'target_count': self.target,
+            'completed': len(learned) >= self.target,
+            'learned_items': learned
+        }
+
+    def stats(self) -> Dict[str, int]:
+        """Entry counts and an estimate of the bytes held by the store."""
+        with self._lock:
+            size = sys.getsizeof(self._days)
+            user_days = 0
+            for users in self._days.values():
+                size += sys.getsizeof(users)
+                user_days += len(users)
+                # Keys are the email strings shared with users_db; count only the arrays
+                size += sum(sys.getsizeof(items) for items in users.values())
+            return {'days': len(self._days), 'user_days': user_days, 'memory_bytes': size}
+
+    def copy(self) -> 'DailyProgressStore':
+        with self._lock:
+            other = DailyProgressStore(self.retention_days, self.target)
+            other._days = {d: {u: array('I', items) for u, items in users.items()} for d, users in self._days.items()}
+            other._newest = self._newest
+            return other
+
+    def __getstate__(self):
+        return {'retention_days': self.retention_days, 'target': self.target, 'days': self._days, 'newest': self._newest}
+
+    def __setstate__(self, state):
+        self.__init__(state['retention_days'], state['target'])
+        self._days = state['days']
+        self._newest = state['newest']
+
+    @classmethod
+    def from_nested(cls, nested: Dict[str, Dict[str, Dict[str, Any]]]) -> 'DailyProgressStore':
+        """Build from the old ``{email: {day: {'learned_items': set, ...}}}`` layout."""
+        store = cls()
+        for user, days in nested.items():
+            for day, progress in sorted(days.items()):
+                for item_id in sorted(progress['learned_items']):
+                    store.add(user, day, item_id)
+        return store
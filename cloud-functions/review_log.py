@@ -0,0 +1,175 @@
+"""
+Columnar, append-only review log
+"""
+
+import os
+import sys
+import tempfile
+import threading
+from array import array
+from typing import Any, Dict, List, Optional
+
+REVIEW_SEGMENT_ROWS = int(os.environ.get('REVIEW_SEGMENT_ROWS', str(1 << 18)))
+
+# column -> (array typecode, numpy dtype); 17 bytes per review
+COLUMNS = {
+    'user': ('I', '<u4'),    # index into ReviewLog.users
+    'item_id': ('I', '<u4'),
+    'rating': ('B', 'u1'),
+    'ts': ('q', '<i8'),      # epoch seconds (UTC)
+}
+MAX_ITEM_ID = 2 ** 32 - 1  # largest id the 'item_id' column holds
+
+def _write(path: str, data) -> None:
+    # Durable before any snapshot can reference it: the journal behind it gets deleted
+    with open(path, 'wb') as f:
+        f.write(data.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+
+class ReviewLog:
+    """
+    Reviews as fixed-width columns instead of one dict per review.
+
+    New reviews go into an in-memory segment of ``array`` columns. Once it
+    holds ``segment_rows`` rows it is spilled to ``spill_dir`` as one raw
+    file per column plus a user-sorted permutation, and from then on is only
+    memory-mapped when scanned. Segments are in append (and so time) order,
+    so a time-range scan skips whole segments by their min/max timestamp and
+    a per-user scan reads only that user's rows through the permutation.
+
+    Scans return NumPy arrays; NumPy is imported on first use so it never
+    weighs on cold starts. Segment files are immutable, and a replayed
+    journal respills identical ones, so snapshots only need to record their
+    metadata.
+    """
+
+    def __init__(self, spill_dir: Optional[str] = None, segment_rows: int = REVIEW_SEGMENT_ROWS):
+        self.spill_dir = spill_dir
+        self.segment_rows = segment_rows
+        self.users: List[str] = []
+        self._user_index: Dict[str, int] = {}
+        self._active = {name: array(code) for name, (code, _) in COLUMNS.items()}
+        self._segments: List[Dict[str, Any]] = []  # {'path', 'rows', 'ts_min', 'ts_max'}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return sum(s['rows'] for s in self._segments) + len(self._active['ts'])
+
+    def user_index(self, email: str) -> int:
+        idx = self._user_index.get(email)
+        if idx is None:
+            idx = self._user_index[email] = len(self.users)
+            self.users.append(email)
+        return idx
+
+    def append(self, email: str, item_id: int, rating: int, ts: int) -> None:
+        # Convert every field first: a value the column cannot hold raises
+        # OverflowError/TypeError here, before any column (or the user list) grows.
+        row = {
+            name: array(COLUMNS[name][0], [value])
+            for name, value in (('item_id', item_id), ('rating', rating), ('ts', ts))
+        }
+        with self._lock:
+            cols = self._active
+            cols['user'].append(self.user_index(email))
+            for name, value in row.items():
+                cols[name].extend(value)
+            if len(cols['ts']) >= self.segment_rows:
+                self._spill()
+
+    def _spill(self) -> None:
+        import numpy as np
+
+        if self.spill_dir is None:
+            self.spill_dir = tempfile.mkdtemp(prefix='reviews-')
+        os.makedirs(self.spill_dir, exist_ok=True)
+        path = os.path.join(self.spill_dir, f"seg-{len(self._segments):06d}")
+        cols = {name: np.frombuffer(self._active[name], dtype=dtype) for name, (_, dtype) in COLUMNS.items()}
+        order = np.argsort(cols['user'], kind='stable').astype('<u4')
+        for name, col in cols.items():
+            _write(f"{path}.{name}", col)
+        _write(f"{path}.order", order)
+        _write(f"{path}.susers", cols['user'][order])
+        self._segments.append({
+            'path': path, 'rows': len(order),
+            'ts_min': int(cols['ts'].min()), 'ts_max': int(cols['ts'].max()),
+        })
+        self._active = {name: array(code) for name, (code, _) in COLUMNS.items()}
+
+    def _load(self, meta: Dict[str, Any], name: str):
+        import numpy as np
+        dtype = COLUMNS[name][1] if name in COLUMNS else '<u4'  # 'order' / 'susers'
+        return np.memmap(f"{meta['path']}.{name}", dtype=dtype, mode='r', shape=(meta['rows'],))
+
+    def scan(self, email: Optional[str] = None, since: Optional[int] = None, until: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Columns ('user', 'item_id', 'rating', 'ts') for reviews by ``email``
+        (all users when None) with ``since <= ts < until``, in append order.
+        """
+        import numpy as np
+
+        user = self._user_index.get(email) if email is not None else None
+        if email is not None and user is None:
+            return {name: np.zeros(0, dtype=dtype) for name, (_, dtype) in COLUMNS.items()}
+        with self._lock:
+            segments = list(self._segments)
+            active = {name: np.frombuffer(self._active[name], dtype=dtype).copy() for name, (_, dtype) in COLUMNS.items()}
+
+        parts = []
+        for meta in segments:
+            if (since is not None and meta['ts_max'] < since) or (until is not None and meta['ts_min'] >= until):
+                continue
+            cols = {name: self._load(meta, name) for name in COLUMNS}
+            if user is not None:
+                lo, hi = np.searchsorted(self._load(meta, 'susers'), [user, user + 1])
+                rows = np.sort(self._load(meta, 'order')[lo:hi])
+                cols = {name: np.asarray(col[rows]) for name, col in cols.items()}
+            parts.append(cols)
+        if user is not None:
+            mask = active['user'] == user
+            active = {name: col[mask] for name, col in active.items()}
+        parts.append(active)
+
+        out = {name: np.concatenate([p[name] for p in parts]) for name in COLUMNS}
+        if since is not None or until is not None:
+            ts = out['ts']
+            mask = np.ones(len(ts), dtype=bool)
+            if since is not None:
+                mask &= ts >= since
+            if until is not None:
+                mask &= ts < until
+            out = {name: col[mask] for name, col in out.items()}
+        return out
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            active = sum(sys.getsizeof(col) for col in self._active.values())
+            return {
+                'rows': len(self),
+                'segments_on_disk': len(self._segments),
+                'active_rows': len(self._active['ts']),
+                'memory_bytes': active + sys.getsizeof(self.users) + sys.getsizeof(self._user_index),
+            }
+
+    def copy(self) -> 'ReviewLog':
+        with self._lock:
+            other = ReviewLog(self.spill_dir, self.segment_rows)
+            other.users = list(self.users)
+            other._user_index = dict(self._user_index)
+            other._active = {name: array(col.typecode, col) for name, col in self._active.items()}
+            other._segments = [dict(s) for s in self._segments]
+            return other
+
+    def __getstate__(self):
+        return {
+            'spill_dir': self.spill_dir, 'segment_rows': self.segment_rows, 'users': self.users,
+            'active': self._active, 'segments': self._segments,
+        }
+
+    def __setstate__(self, state):
+        self.__init__(state['spill_dir'], state['segment_rows'])
+        self.users = state['users']
+        self._user_index = {email: i for i, email in enumerate(self.users)}
+        self._active = state['active']
+        self._segments = state['segments']
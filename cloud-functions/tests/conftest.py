@@ -0,0 +1,20 @@
+import os
+import sys
+
+import pytest
+from functions_framework import create_app
+
+SOURCE = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "main.py"))
+sys.path.insert(0, os.path.dirname(SOURCE))
+os.environ.pop("STATE_DIR", None)  # in-memory store
+
+
+@pytest.fixture
+def client():
+    return create_app(target="german_buddy_api", source=SOURCE).test_client()
+
+
+@pytest.fixture
+def auth():
+    import main
+    return {"Authorization": f"Bearer {main.create_jwt_token('learner@example.com')}"}
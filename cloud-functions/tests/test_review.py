@@ -0,0 +1,24 @@
+import pytest
+
+
+@pytest.mark.parametrize("item_id", [-1, 2 ** 32])
+def test_out_of_range_item_id_is_rejected_and_log_stays_readable(client, auth, item_id):
+    r = client.post("/pwa/review", json={"item_id": item_id, "rating": 2}, headers=auth)
+    assert r.status_code == 400
+
+    assert client.post("/pwa/review", json={"item_id": 3, "rating": 3}, headers=auth).status_code == 200
+    r = client.get("/reviews/summary", headers=auth)
+    assert r.status_code == 200
+    assert r.get_json()["by_rating"]["3"] >= 1
+
+
+def test_append_leaves_columns_aligned_on_overflow():
+    from review_log import ReviewLog
+
+    log = ReviewLog()
+    with pytest.raises(OverflowError):
+        log.append("learner@example.com", 2 ** 32, 2, 0)
+    log.append("learner@example.com", 7, 2, 0)
+    cols = log.scan()
+    assert [len(c) for c in cols.values()] == [1, 1, 1, 1]
+    assert log.users == ["learner@example.com"]
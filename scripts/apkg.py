@@ -0,0 +1,100 @@
+"""
+Read Anki .apkg packages in place.
+
+An .apkg is a zip holding the collection database, a `media` JSON map
+("0" -> "file.mp3") and the media files stored under those numbers.
+ApkgReader copies only the collection out, to a temp file SQLite can open,
+and opens media members on demand, so nothing else touches the disk.
+
+    with ApkgReader('GermanDB/deck.apkg') as pkg:
+        con = pkg.connect()
+        with pkg.open_media('sapi5-....mp3') as f:
+            data = f.read()
+"""
+
+import os
+import json
+import shutil
+import sqlite3
+import zipfile
+import tempfile
+
+# Newer exports put a placeholder collection.anki2 next to the real collection.anki21
+COLLECTIONS = ('collection.anki21', 'collection.anki2')
+
+
+class ApkgReader:
+    """One .apkg file; use as a context manager so the temp collection is removed."""
+
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.splitext(os.path.basename(path))[0]
+        self._zip = None
+        self._collection = None
+        self._media = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def zip(self):
+        if self._zip is None:
+            self._zip = zipfile.ZipFile(self.path)
+        return self._zip
+
+    def collection_member(self):
+        """Zip member holding the collection: collection.anki21 when present."""
+        names = set(self.zip.namelist())
+        member = next((n for n in COLLECTIONS if n in names), None)
+        if member is None:
+            raise ValueError(f"{self.path}: no {' or '.join(COLLECTIONS)} (zstd-compressed collection.anki21b is not supported)")
+        return member
+
+    def collection_path(self):
+        """Path of the collection database, extracted to a temp file on first use."""
+        if self._collection is None:
+            member = self.collection_member()
+            fd, tmp = tempfile.mkstemp(prefix=f"{self.name[:40]}-", suffix='.anki2')
+            with os.fdopen(fd, 'wb') as out, self.zip.open(member) as src:
+                shutil.copyfileobj(src, out, 1 << 20)
+            self._collection = tmp
+        return self._collection
+
+    def connect(self):
+        """Read-only SQLite connection to the collection."""
+        return sqlite3.connect(f"file:{self.collection_path()}?mode=ro", uri=True)
+
+    @property
+    def media(self):
+        """Media file name -> zip member, read from the `media` map on first access."""
+        if self._media is None:
+            try:
+                raw = self.zip.read('media')
+            except KeyError:
+                raw = b'{}'
+            try:
+                self._media = {name: member for member, name in json.loads(raw or b'{}').items()}
+            except ValueError:
+                raise ValueError(f"{self.path}: media map is not JSON (Anki 2.1.50+ exports are not supported)")
+        return self._media
+
+    def media_size(self, name):
+        return self.zip.getinfo(self.media[name]).file_size
+
+    def open_media(self, name):
+        """Binary stream of one media file, decompressed as it is read."""
+        return self.zip.open(self.media[name])
+
+    def close(self):
+        if self._zip is not None:
+            self._zip.close()
+            self._zip = None
+        if self._collection is not None:
+            try:
+                os.remove(self._collection)
+            except OSError:
+                pass
+            self._collection = None
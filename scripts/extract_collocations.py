@@ -0,0 +1,281 @@
+"""
+Extract collocations from the Anki sentence decks.
+
+Regenerates GermanDB/output/collocations_extracted.csv in the schema
+import_collocations.py reads (german, frequency, pattern, example_sentence,
+translation, sources), and optionally verb_preposition_patterns.csv.
+
+Sentences are streamed from every deck (.apkg or unzipped, as in
+import_unzipped_anki_decks.py) plus any sentence CSVs given with
+--sentences-csv, and tokenised in a process pool in two passes:
+
+  1. every adjacent word pair is hashed into a count-min sketch, so memory
+     stays fixed however many distinct pairs the corpus has;
+  2. pairs whose sketch estimate reaches --min-count are counted exactly,
+     with unigram counts, source decks and the cleanest example sentence.
+
+Candidates are ranked by Dunning's log-likelihood ratio; pairs made only of
+function words are dropped. The best --top are written, most frequent first.
+
+    python scripts/extract_collocations.py
+    python scripts/extract_collocations.py --sentences-csv GermanDB/output/sentences_sample.csv --top 2000
+"""
+
+import os
+import re
+import csv
+import sys
+import zlib
+import time
+import argparse
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Add the backend directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'backend')))
+
+import numpy as np
+from app.text_analysis import FUNCTION_WORDS, tokenize
+from import_unzipped_anki_decks import EXTRACT_DIR, deck_sources, open_collection, note_type_fields, note_text
+
+OUTPUT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'GermanDB', 'output'))
+FIELDNAMES = ['german', 'frequency', 'pattern', 'example_sentence', 'translation', 'sources']
+VERB_PREP_FIELDNAMES = ['pattern', 'example', 'translation', 'count']
+
+SOURCE_NAME_LENGTH = 30  # sources hold deck names cut to this length, as before
+SKETCH_DEPTH = 4
+SKETCH_SEEDS = np.array([0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9, 0x27D4EB2F165667C5], dtype=np.uint64)
+
+SEIN = frozenset('sein bin bist ist sind seid war warst waren wart wäre wärst wären gewesen'.split())
+HABEN = frozenset('haben habe hast hat habt hatte hattest hatten hätte hättest hätten gehabt'.split())
+MACHEN = frozenset('machen mache machst macht machte machten gemacht'.split())
+GEHEN = frozenset('gehen gehe gehst geht ging gingen gegangen'.split())
+PREPOSITIONS = frozenset('an auf aus bei durch für gegen in mit nach ohne über um unter von vor zu zum zur zwischen'.split())
+
+CLOZE_GAP_RE = re.compile(r'\.{2,}|\+')
+
+_sketch = None
+_min_count = 0
+
+
+def sentence_chunks(sources, csv_paths, chunk_size):
+    """Lists of (german, english, deck), streamed from decks and sentence CSVs."""
+    for source in sources:
+        with open_collection(source) as (deck, con):
+            fields = note_type_fields(con)
+            cur = con.execute("SELECT mid, flds FROM notes")
+            while True:
+                notes = cur.fetchmany(chunk_size)
+                if not notes:
+                    break
+                yield [(*note_text(fields, mid, flds), deck) for mid, flds in notes]
+    for path in csv_paths:
+        with open(path, newline='', encoding='utf-8') as f:
+            chunk = []
+            for row in csv.DictReader(f):
+                chunk.append((row['german'], row.get('english', ''), row.get('source_deck') or os.path.basename(path)))
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
+            if chunk:
+                yield chunk
+
+
+def pair_hash(pair):
+    data = pair.encode('utf-8')
+    return (zlib.crc32(data) << 32) | zlib.crc32(data, 0x5BD1E995)
+
+
+def sketch_columns(hashes, width):
+    """Column of every hash in each sketch row, shape (SKETCH_DEPTH, n)."""
+    mixed = hashes[None, :] * SKETCH_SEEDS[:, None]  # wraps mod 2**64
+    return ((mixed >> np.uint64(29)) % np.uint64(width)).astype(np.int64)
+
+
+def pairs(words):
+    return [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+def hash_chunk(chunk):
+    """Pass 1 worker: hashes of every word pair in the chunk."""
+    return np.fromiter((pair_hash(p) for german, _, _ in chunk for p in pairs(tokenize(german))), dtype=np.uint64)
+
+
+def init_counter(sketch, min_count):
+    global _sketch, _min_count
+    _sketch, _min_count = sketch, min_count
+
+
+def example_score(german, english):
+    """Lower is better; None when the sentence is unfit as an example."""
+    words = german.split()
+    if not (4 <= len(words) <= 16) or not english or CLOZE_GAP_RE.search(german):
+        return None
+    if not german[0].isupper() or german[-1] not in '.!?':
+        return None
+    return abs(len(words) - 9), len(german)
+
+
+def count_chunk(chunk):
+    """
+    Pass 2 worker: exact counts for the pairs the sketch lets through, plus
+    unigram counts, the decks each pair occurs in and its best example.
+    """
+    unigrams, counts, decks, examples = Counter(), Counter(), {}, {}
+    for german, english, deck in chunk:
+        words = tokenize(german)
+        unigrams.update(words)
+        found = pairs(words)
+        if not found:
+            continue
+        hashes = np.fromiter((pair_hash(p) for p in found), dtype=np.uint64, count=len(found))
+        estimate = _sketch[np.arange(SKETCH_DEPTH)[:, None], sketch_columns(hashes, _sketch.shape[1])].min(axis=0)
+        score = None
+        for pair, est in zip(found, estimate):
+            if est < _min_count:
+                continue
+            counts[pair] += 1
+            decks.setdefault(pair, set()).add(deck)
+            if score is None:
+                score = example_score(german.strip(), english.strip()) or False
+            if score and (pair not in examples or score < examples[pair][0]):
+                examples[pair] = (score, german.strip(), english.strip())
+    return unigrams, counts, decks, examples
+
+
+def run_pool(pool, fn, chunks, workers, consume):
+    """Submit chunks as they stream in, keeping at most 2 x workers in flight."""
+    pending = set()
+    for chunk in chunks:
+        if len(pending) >= workers * 2:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                consume(fut.result())
+        pending.add(pool.submit(fn, chunk))
+    for fut in pending:
+        consume(fut.result())
+
+
+def log_likelihood(k11, c1, c2, n):
+    """Dunning's G2 for pair counts k11 with first/second word counts c1, c2 out of n."""
+    k = np.stack([k11, c1 - k11, c2 - k11, n - c1 - c2 + k11]).astype(np.float64)
+    rows = np.stack([c1, c1, n - c1, n - c1]).astype(np.float64)
+    cols = np.stack([c2, n - c2, c2, n - c2]).astype(np.float64)
+    expected = rows * cols / n
+    with np.errstate(divide='ignore', invalid='ignore'):
+        terms = np.where(k > 0, k * np.log(k / expected), 0.0)
+    return 2 * terms.sum(axis=0)
+
+
+def pattern_of(a, b):
+    if a in SEIN or b in SEIN:
+        return 'sein_adj'
+    if a in HABEN or b in HABEN:
+        return 'haben_noun'
+    if 'sich' in (a, b):
+        return 'sich_verb'
+    if a in MACHEN or b in MACHEN:
+        return 'machen_noun'
+    if a in GEHEN and b in PREPOSITIONS:
+        return 'gehen_prep'
+    if b == 'zu':
+        return 'verb_zu'
+    name = f"{a}_{b}"
+    for umlaut, plain in (('ä', 'ae'), ('ö', 'oe'), ('ü', 'ue'), ('ß', 'ss')):
+        name = name.replace(umlaut, plain)
+    return name
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--source-dir', default=EXTRACT_DIR, help='directory of .apkg files and/or unzipped deck directories')
+    parser.add_argument('--sentences-csv', nargs='*', default=[], help='extra corpora with german/english/source_deck columns')
+    parser.add_argument('--out', default=os.path.join(OUTPUT_DIR, 'collocations_extracted.csv'))
+    parser.add_argument('--verb-prep-out', default=None, help='also write verb_preposition_patterns.csv here')
+    parser.add_argument('--top', type=int, default=1000)
+    parser.add_argument('--min-count', type=int, default=5)
+    parser.add_argument('--sketch-width', type=int, default=1 << 21)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    args = parser.parse_args()
+
+    started = time.monotonic()
+    sources = deck_sources(args.source_dir) if os.path.isdir(args.source_dir) else []
+
+    def chunks():
+        return sentence_chunks(sources, args.sentences_csv, args.chunk_size)
+
+    sketch = np.zeros((SKETCH_DEPTH, args.sketch_width), dtype=np.uint32)
+    rows = np.arange(SKETCH_DEPTH)[:, None]
+
+    def add_to_sketch(hashes):
+        np.add.at(sketch, (rows, sketch_columns(hashes, args.sketch_width)), 1)
+
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        run_pool(pool, hash_chunk, chunks(), args.workers, add_to_sketch)
+    total_pairs = int(sketch[0].sum())
+
+    unigrams, counts, decks, examples = Counter(), Counter(), {}, {}
+
+    def merge(result):
+        u, c, d, e = result
+        unigrams.update(u)
+        counts.update(c)
+        for pair, found in d.items():
+            decks.setdefault(pair, set()).update(found)
+        for pair, example in e.items():
+            if pair not in examples or example[0] < examples[pair][0]:
+                examples[pair] = example
+
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=init_counter, initargs=(sketch, args.min_count)) as pool:
+        run_pool(pool, count_chunk, chunks(), args.workers, merge)
+
+    candidates = [p for p, c in counts.items() if c >= args.min_count and not set(p.split()) <= FUNCTION_WORDS]
+    split = [p.split() for p in candidates]
+    k11 = np.array([counts[p] for p in candidates], dtype=np.int64)
+    c1 = np.array([unigrams[a] for a, _ in split], dtype=np.int64)
+    c2 = np.array([unigrams[b] for _, b in split], dtype=np.int64)
+    scores = log_likelihood(k11, c1, c2, max(total_pairs, 1)) if candidates else np.zeros(0)
+    best = [candidates[i] for i in np.argsort(-scores, kind='stable')[:args.top]]
+    best.sort(key=lambda p: (-counts[p], p))
+
+    with open(args.out, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDNAMES)
+        writer.writeheader()
+        for pair in best:
+            _, example, translation = examples.get(pair, (None, '', ''))
+            writer.writerow({
+                'german': pair,
+                'frequency': counts[pair],
+                'pattern': pattern_of(*pair.split()),
+                'example_sentence': example,
+                'translation': translation,
+                'sources': str(sorted({d[:SOURCE_NAME_LENGTH] for d in decks[pair]})),
+            })
+
+    if args.verb_prep_out:
+        def is_verb_prep(pair):
+            # Without a tagger: the first word must be lower-case in the example, which rules out German nouns
+            first, second = pair.split()
+            return second in PREPOSITIONS and first not in FUNCTION_WORDS and pair in examples and \
+                re.search(rf'(?<!\w){re.escape(first)}(?!\w)', examples[pair][1]) is not None
+
+        verb_prep = [p for p in best if is_verb_prep(p)]
+        with open(args.verb_prep_out, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=VERB_PREP_FIELDNAMES)
+            writer.writeheader()
+            for pair in verb_prep:
+                _, example, translation = examples[pair]
+                writer.writerow({'pattern': pair, 'example': example, 'translation': translation, 'count': counts[pair]})
+
+    elapsed = time.monotonic() - started
+    tokens = sum(unigrams.values())
+    print(f"{tokens} tokens, {total_pairs} word pairs, {len(counts)} sketch candidates, "
+          f"{len(best)} collocations written to {args.out} in {elapsed:.1f}s ({tokens / max(elapsed, 1e-9):.0f} tokens/s)")
+
+
+if __name__ == "__main__":
+    main()
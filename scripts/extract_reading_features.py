@@ -0,0 +1,139 @@
+
+"""
+Compute lexical features for reading items.
+
+Tokenises every reading whose content changed since its features were last
+computed (or whose features predate FEATURES_VERSION) and stores type/token
+ratio, sentence lengths, subordinate-clause markers and frequency-band
+coverage in `features_json`, plus the real token count in `tokens`. Work is
+spread over a process pool; an unchanged corpus is skipped with one query.
+
+Readings stored before lemma blobs existed (lemma_ids NULL) get them here
+too, which adds them to the /reading/recommended index.
+
+    python scripts/extract_reading_features.py
+    python scripts/extract_reading_features.py --force --workers 8
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Add the backend directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'backend')))
+
+from sqlalchemy import select, update, bindparam, literal, func, or_
+from app.database import engine
+from app.reading import ReadingItem, init_reading_db, READING_NAMESPACE, _lemma_blobs
+from app.text_analysis import FEATURES_VERSION, lemma_counts, load_frequency_bands, text_features
+from app.cache import invalidate
+
+BANDS_CSV = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'GermanDB', 'output', 'collocations_extracted.csv'))
+
+_bands = None
+
+
+def init_worker(bands_csv):
+    global _bands
+    _bands = load_frequency_bands(bands_csv)
+
+
+def extract(rows):
+    """
+    Worker: features for a batch of (id, text, stamp, unindexed) rows, as
+    UPDATE parameters; unindexed rows also carry their lemma counts.
+    """
+    out = []
+    for item_id, text, stamp, unindexed in rows:
+        features = text_features(text, _bands)
+        out.append({
+            "_id": item_id,
+            "features_json": json.dumps(features, ensure_ascii=False),
+            "tokens": features["tokens"],
+            "features_hash": stamp,
+            "lemmas": dict(lemma_counts(text)) if unindexed else None,
+        })
+    return out
+
+
+def pending_stmt(force):
+    # Legacy rows without a content_hash are stamped "<version>:" and, since their
+    # text never changes, are not picked up again until the version is bumped.
+    stamp = literal(f"{FEATURES_VERSION}:") + func.coalesce(ReadingItem.content_hash, "")
+    # A reading without words keeps NULL lemma blobs and is re-read on every run; that costs nothing.
+    unindexed = ReadingItem.lemma_ids.is_(None)
+    stmt = select(ReadingItem.id, ReadingItem.text, stamp.label("stamp"), unindexed.label("unindexed"))
+    if not force:
+        stmt = stmt.where(or_(ReadingItem.features_hash.is_(None), ReadingItem.features_hash != stamp, unindexed))
+    return stmt.order_by(ReadingItem.id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--batch-size', type=int, default=500, help='readings per worker task')
+    parser.add_argument('--bands-csv', default=BANDS_CSV)
+    parser.add_argument('--force', action='store_true', help='recompute every reading')
+    args = parser.parse_args()
+
+    init_reading_db()
+    started = time.monotonic()
+    table = ReadingItem.__table__
+    write = (
+        update(table)
+        .where(table.c.id == bindparam("_id"))
+        .values(features_json=bindparam("features_json"), tokens=bindparam("tokens"), features_hash=bindparam("features_hash"))
+    )
+    write_lemmas = (
+        update(table)
+        .where(table.c.id == bindparam("_id"))
+        .values(lemma_ids=bindparam("lemma_ids"), lemma_counts=bindparam("lemma_counts"))
+    )
+    stmt = pending_stmt(args.force)
+    updated, indexed, last_id, pending = 0, 0, 0, set()
+
+    def drain(done):
+        nonlocal updated, indexed
+        for fut in done:
+            rows = fut.result()
+            lemmas = [(r["_id"], r.pop("lemmas")) for r in rows]
+            lemmas = [(i, c) for i, c in lemmas if c is not None]
+            with engine.begin() as conn:
+                conn.execute(write, rows)
+                if lemmas:
+                    blobs = _lemma_blobs(conn, [c for _, c in lemmas])
+                    conn.execute(write_lemmas, [
+                        {"_id": i, "lemma_ids": ids, "lemma_counts": counts} for (i, _), (ids, counts) in zip(lemmas, blobs)
+                    ])
+                    indexed += sum(ids is not None for ids, _ in blobs)
+            updated += len(rows)
+
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker, initargs=(args.bands_csv,)) as pool:
+        while True:
+            # Keyset batches rather than one long cursor, so writes never wait on an open read.
+            with engine.connect() as conn:
+                rows = [tuple(r) for r in conn.execute(stmt.where(ReadingItem.id > last_id).limit(args.batch_size))]
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            if len(pending) >= args.workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                drain(done)
+            pending.add(pool.submit(extract, rows))
+        drain(pending)
+
+    if updated:
+        invalidate(READING_NAMESPACE)
+    elapsed = time.monotonic() - started
+    print(f"Updated features for {updated} readings ({indexed} newly indexed) in {elapsed:.1f}s "
+          f"({updated / max(elapsed, 1e-9):.0f} readings/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,7 @@
 import os
 import sys
 import csv
-from sqlalchemy import create_engine, text
+import argparse
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -10,30 +10,37 @@ load_dotenv()
 # Add the backend directory to the Python path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'backend')))
 
-from app.database import Item, SessionLocal, init_db, Base
-
-CSV_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'germandb', 'output', 'collocations_extracted.csv'))
+from app.database import Item, init_db
+from app.catalog import load_catalog
+from app.cache import invalidate
+
+CSV_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'GermanDB', 'output', 'collocations_extracted.csv'))
+KIND = 'collocation'
+
+def catalog_rows(path):
+    with open(path, 'r', newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            yield {
+                'natural_key': f"{KIND}:{row['german']}",
+                'german': row['german'],
+                'english': row['translation'],
+                'frequency': int(row['frequency']),
+                'pattern': row['pattern'],
+                'source': row['sources'],
+            }
 
 def main():
-    engine = SessionLocal().get_bind()
-    Base.metadata.drop_all(bind=engine)
-    Base.metadata.create_all(bind=engine)
-    db = SessionLocal()
-
-    with open(CSV_PATH, 'r') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            item = Item(
-                german=row['german'],
-                english=row['translation'],
-                frequency=int(row['frequency']),
-                pattern=row['pattern'],
-                source=row['sources']
-            )
-            db.add(item)
-
-    db.commit()
-    db.close()
+    # Reloads in place while the API is serving: ids, user progress and other items are kept
+    parser = argparse.ArgumentParser(description='Load collocations_extracted.csv into the items catalog')
+    parser.add_argument('--csv', default=CSV_PATH)
+    args = parser.parse_args()
+
+    init_db()
+    # Collocations loaded before natural keys existed are the keyless items with a pattern
+    stats = load_catalog(catalog_rows(args.csv), KIND, legacy=Item.pattern.isnot(None))
+    invalidate("items")
+    print(f"{stats['staged']} collocations staged: {stats['merged']} loaded ({stats['adopted']} existing items adopted), "
+          f"{stats['retired']} retired ({stats['orphaned']} unadopted older items); catalog version {stats['version']}")
 
 if __name__ == "__main__":
     main()
@@ -10,6 +10,7 @@ load_dotenv()
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'backend')))
 
 from app.database import Item, SessionLocal, init_db
+from app.cache import invalidate
 
 DAILY_PHRASES = [
     {
@@ -106,6 +107,7 @@ def main():
         )
         db.add(item)
     db.commit()
+    invalidate("items")
     db.close()
 
 if __name__ == "__main__":
@@ -1,8 +1,43 @@
+"""
+Load the notes of unzipped Anki decks into the items table.
+
+Each deck, either an .apkg package (read in place through ApkgReader) or
+an unzipped GermanDB/extracted/<deck>/ directory, is read by its own worker
+process: notes are streamed with fetchmany, the German and English fields
+are picked per note type (FIELD_MAP, falling back to Front/Back or the
+first two fields), HTML, [sound:] tags and bracket decoration are
+stripped, and rows are written in chunks with one executemany per chunk,
+or COPY on Postgres. Rows per second are reported per deck and overall.
+
+With --incremental every note, skipped ones included, is recorded in the
+anki_notes manifest (deck, guid, mod, content hash, item id), and a re-run
+touches only what changed: notes whose mod is unchanged are skipped before
+their fields are even parsed, edited notes update their item in place
+(same id, so user progress stays attached), new notes are inserted, and
+notes that left the deck or can no longer be imported have their items
+retired rather than deleted (the former are also tombstoned). On a
+database filled by plain runs, the first --incremental run adopts the
+existing items by German text instead of inserting every note again.
+
+    python scripts/import_unzipped_anki_decks.py
+    python scripts/import_unzipped_anki_decks.py --workers 4 --chunk-size 10000
+    python scripts/import_unzipped_anki_decks.py --incremental
+    python scripts/import_unzipped_anki_decks.py --source-dir GermanDB  # the .apkg files
+"""
 
 import os
+import io
+import re
+import csv
 import sys
+import json
+import html
+import time
 import sqlite3
-from sqlalchemy import create_engine, text
+import hashlib
+import argparse
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -10,40 +45,363 @@ load_dotenv()
 # Add the backend directory to the Python path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'backend')))
 
-from app.database import Item, SessionLocal, init_db
+from sqlalchemy import insert, update, select, bindparam, false, or_
+from app.database import Item, AnkiNote, engine, init_db, upsert
+from app.catalog import bump_catalog_version
+from app.cache import invalidate
+from apkg import ApkgReader
 
-EXTRACT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'germandb', 'extracted'))
+EXTRACT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'GermanDB', 'extracted'))
 
-def main():
-    init_db()
-    db = SessionLocal()
+# Note type name -> (German field, English field); None when the deck has no translation
+# (its notes are then skipped, since an exercise needs both sides)
+FIELD_MAP = {
+    'sentences_sorted_by_difficulty': ('sentence', 'translation'),
+    'LoF cloze': ('Text', 'Back'),
+    'Cloze': ('Text', 'Back Extra'),
+    # Verben mit Präpositionen: Front is the sentence with "....." gaps, Back the filled-in German,
+    # and neither is English; mapped so its gap sentences are never imported as translations
+    'Basic-5164b': ('Back', None),
+}
+DEFAULT_FIELDS = ('Front', 'Back')
+
+COPY_COLUMNS = ('german', 'english', 'frequency', 'source')
+
+TAG_RE = re.compile(r'<[^>]+>')
+BREAK_RE = re.compile(r'<br\s*/?>|</div>|</p>|</li>', re.I)
+SOUND_RE = re.compile(r'\[sound:[^\]]*\]')
+CLOZE_RE = re.compile(r'\{\{c\d+::(.*?)(?:::[^}]*)?\}\}')
+SPACE_RE = re.compile(r'\s+')
+# "— [ translation ]" as used by the 7000 sentences decks
+DECORATION_RE = re.compile(r'^[—–-]\s*(?:\[\s*(.*?)\s*\])?')
+
+
+def clean_field(value):
+    """Plain text of an Anki field: no markup, media references or decoration."""
+    text = CLOZE_RE.sub(r'\1', SOUND_RE.sub('', value))
+    text = TAG_RE.sub('', BREAK_RE.sub(' ', text))
+    text = SPACE_RE.sub(' ', html.unescape(text)).strip()
+    m = DECORATION_RE.match(text)
+    if m:
+        text = m.group(1) if m.group(1) is not None else text[m.end():].strip()
+    return text
+
+
+def collection_path(deck_dir):
+    # Newer exports ship a placeholder collection.anki2 next to the real collection.anki21
+    for name in ('collection.anki21', 'collection.anki2'):
+        path = os.path.join(deck_dir, name)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def note_type_fields(con):
+    """Note type id -> (german index, english index or None)."""
+    tables = {r[0] for r in con.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    names, fields = {}, {}
+    if 'notetypes' in tables:  # schema 18+: one row per note type and per field
+        names = dict(con.execute("SELECT id, name FROM notetypes"))
+        for ntid, ord_, name in con.execute("SELECT ntid, ord, name FROM fields ORDER BY ntid, ord"):
+            fields.setdefault(ntid, []).append(name)
+    else:
+        for mid, model in json.loads(con.execute("SELECT models FROM col").fetchone()[0] or '{}').items():
+            names[int(mid)] = model['name']
+            fields[int(mid)] = [f['name'] for f in sorted(model['flds'], key=lambda f: f['ord'])]
 
-    for dir in os.listdir(EXTRACT_DIR):
-        db_path = os.path.join(EXTRACT_DIR, dir, 'collection.anki2')
-        if os.path.exists(db_path):
+    mapping = {}
+    for ntid, field_names in fields.items():
+        german, english = FIELD_MAP.get(names.get(ntid), DEFAULT_FIELDS)
+        if german in field_names and (english is None or english in field_names):
+            mapping[ntid] = (field_names.index(german), None if english is None else field_names.index(english))
+        else:
+            mapping[ntid] = (0, 1)
+    return mapping
+
+
+def note_text(fields, mid, flds):
+    """(german, english) of a note; empty strings when a field is missing."""
+    values = flds.split('\x1f')
+    g, e = fields.get(mid, (0, 1))
+    german = clean_field(values[g]) if g < len(values) else ''
+    english = clean_field(values[e]) if e is not None and e < len(values) else ''
+    return german, english
+
+
+def importable(german, english):
+    """Notes need both German text and a translation."""
+    return bool(german) and bool(english)
+
+
+def content_hash(german, english):
+    return hashlib.sha1(f"{german}\x1f{english}".encode('utf-8')).hexdigest()
+
+
+def deck_sources(source_dir):
+    """.apkg files and unzipped deck directories under source_dir."""
+    paths = [os.path.join(source_dir, name) for name in sorted(os.listdir(source_dir))]
+    return [p for p in paths if (p.endswith('.apkg') and os.path.isfile(p)) or (os.path.isdir(p) and collection_path(p))]
+
+
+@contextmanager
+def open_collection(source):
+    """(deck name, read-only connection) for an .apkg file or an unzipped deck directory."""
+    if source.endswith('.apkg'):
+        with ApkgReader(source) as pkg:
+            con = pkg.connect()
             try:
-                con = sqlite3.connect(db_path)
-                cur = con.cursor()
-                res = cur.execute("SELECT flds FROM notes")
-                for row in res.fetchall():
-                    fields = row[0].split('\x1f')
-                    # This is still a guess, but it's a more educated one.
-                    german = fields[0]
-                    english = fields[1]
-
-                    item = Item(
-                        german=german,
-                        english=english,
-                        level="unknown",
-                        frequency=0
-                    )
-                    db.add(item)
+                yield pkg.name, con
+            finally:
                 con.close()
+        return
+    con = sqlite3.connect(f"file:{collection_path(source)}?mode=ro", uri=True)
+    try:
+        yield os.path.basename(source), con
+    finally:
+        con.close()
+
+
+def copy_rows(conn, rows):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerows([r[c] for c in COPY_COLUMNS] for r in rows)
+    buf.seek(0)
+    with conn.connection.dbapi_connection.cursor() as cur:
+        cur.copy_expert(f"COPY items ({', '.join(COPY_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buf)
+
+
+def write_rows(rows):
+    with engine.begin() as conn:
+        if conn.dialect.name == 'postgresql':
+            copy_rows(conn, rows)
+        else:
+            conn.execute(insert(Item.__table__), rows)
+
+
+def init_worker():
+    # Never reuse connections inherited from the parent process
+    engine.dispose(close=False)
+
+
+def load_deck(source, chunk_size):
+    """Worker: stream one deck into items. Returns (deck, rows written, skipped, seconds)."""
+    started = time.monotonic()
+    written = skipped = 0
+    with open_collection(source) as (deck, con):
+        fields = note_type_fields(con)
+        cur = con.execute("SELECT mid, flds FROM notes ORDER BY id")
+        while True:
+            notes = cur.fetchmany(chunk_size)
+            if not notes:
+                break
+            rows = []
+            for mid, flds in notes:
+                german, english = note_text(fields, mid, flds)
+                if importable(german, english):
+                    rows.append({'german': german, 'english': english, 'frequency': 0, 'source': deck})
+                else:
+                    skipped += 1
+            if rows:
+                write_rows(rows)
+                written += len(rows)
+    return deck, written, skipped, time.monotonic() - started
+
+
+ITEM_UPDATE = (
+    update(Item.__table__)
+    .where(Item.__table__.c.id == bindparam('_id'))
+    .values(german=bindparam('german'), english=bindparam('english'), retired=False)
+)
+ITEM_RETIRE = update(Item.__table__).where(Item.__table__.c.id == bindparam('_id')).values(retired=True)
+MANIFEST_COLUMNS = ['mod', 'content_hash', 'item_id', 'deleted']
+
+
+def sync_chunk(conn, deck, inserts, updates, retire, manifest):
+    """Apply one chunk of changes; inserts are (guid, mod, hash, item row) tuples, retire item ids."""
+    if inserts:
+        stmt = insert(Item.__table__).returning(Item.__table__.c.id, sort_by_parameter_order=True)
+        ids = conn.execute(stmt, [row for _, _, _, row in inserts]).scalars().all()
+        manifest += [
+            {'deck': deck, 'guid': guid, 'mod': mod, 'content_hash': h, 'item_id': item_id, 'deleted': False}
+            for (guid, mod, h, _), item_id in zip(inserts, ids)
+        ]
+    if updates:
+        conn.execute(ITEM_UPDATE, updates)
+    if retire:
+        conn.execute(ITEM_RETIRE, [{'_id': item_id} for item_id in retire])
+    upsert(conn, AnkiNote.__table__, manifest, ['deck', 'guid'], MANIFEST_COLUMNS)
+
+
+def legacy_items(conn, deck, claimed):
+    """
+    German text -> [(item id, content hash)], oldest first, of the deck's
+    live items no manifest row claims: those loaded without --incremental.
+    """
+    legacy = {}
+    for item_id, german, english in conn.execute(
+        select(Item.id, Item.german, Item.english).where(Item.source == deck, Item.retired == false()).order_by(Item.id)
+    ):
+        if item_id not in claimed:
+            legacy.setdefault(german, []).append((item_id, content_hash(german, english)))
+    return legacy
+
+
+def take_legacy(legacy, german, flds):
+    """
+    Claim a legacy item for a note: the oldest one whose German is the
+    note's German or the text of any of its fields (an item imported under
+    an earlier FIELD_MAP), so the item users have progress on is kept.
+    """
+    texts = {german, *(clean_field(v) for v in flds.split('\x1f'))}
+    best = min((t for t in texts if legacy.get(t)), key=lambda t: legacy[t][0][0], default=None)
+    return None if best is None else legacy[best].pop(0)
+
+
+def sync_deck(source, chunk_size):
+    """
+    Worker: bring one deck's items in line with the manifest. Returns
+    (deck, {'inserted', 'adopted', 'updated', 'retired', 'unchanged', 'skipped', 'orphaned', 'stale'}, seconds).
+
+    Items loaded by a full import have no manifest rows yet; the first
+    incremental run adopts them by German text instead of inserting the
+    notes again, and retires ('orphaned') those no note claims.
+
+    Skipped notes are recorded too (without an item), so an unchanged one
+    is not parsed again. A note that can no longer be imported retires its
+    item, as does one that left the deck. Live items failing importable()
+    ('stale': imported under looser rules, notes unchanged since) are retired.
+    """
+    started = time.monotonic()
+    counts = dict.fromkeys(['inserted', 'adopted', 'updated', 'retired', 'unchanged', 'skipped', 'orphaned', 'stale'], 0)
+    seen = set()
+    with open_collection(source) as (deck, con):
+        with engine.connect() as conn:
+            known = {
+                guid: (mod, h, item_id, deleted)
+                for guid, mod, h, item_id, deleted in conn.execute(
+                    select(AnkiNote.guid, AnkiNote.mod, AnkiNote.content_hash, AnkiNote.item_id, AnkiNote.deleted)
+                    .where(AnkiNote.deck == deck)
+                )
+            }
+            legacy = legacy_items(conn, deck, {old[2] for old in known.values()})
+        fields = note_type_fields(con)
+        cur = con.execute("SELECT guid, mid, mod, flds FROM notes ORDER BY id")
+        while True:
+            notes = cur.fetchmany(chunk_size)
+            if not notes:
+                break
+            inserts, updates, retire, manifest = [], [], [], []
+            for guid, mid, mod, flds in notes:
+                seen.add(guid)
+                old = known.get(guid)
+                if old is not None and old[0] == mod and not old[3]:
+                    counts['unchanged' if old[2] is not None else 'skipped'] += 1
+                    continue
+                german, english = note_text(fields, mid, flds)
+                h = content_hash(german, english)
+                if not importable(german, english):
+                    item_id = old[2] if old is not None else None
+                    if item_id is not None and not old[3]:
+                        retire.append(item_id)
+                        counts['retired'] += 1
+                    else:
+                        counts['skipped'] += 1
+                    manifest.append({'deck': deck, 'guid': guid, 'mod': mod, 'content_hash': h, 'item_id': item_id, 'deleted': False})
+                    continue
+                if old is None and legacy:
+                    adopted = take_legacy(legacy, german, flds)
+                    if adopted is not None:
+                        item_id, item_hash = adopted
+                        if item_hash != h:
+                            updates.append({'_id': item_id, 'german': german, 'english': english})
+                            counts['updated'] += 1
+                        else:
+                            counts['adopted'] += 1
+                        manifest.append({'deck': deck, 'guid': guid, 'mod': mod, 'content_hash': h, 'item_id': item_id, 'deleted': False})
+                        continue
+                if old is None or old[2] is None:
+                    inserts.append((guid, mod, h, {'german': german, 'english': english, 'frequency': 0, 'source': deck}))
+                    counts['inserted'] += 1
+                    continue
+                if old[1] != h or old[3]:
+                    updates.append({'_id': old[2], 'german': german, 'english': english})
+                    counts['updated'] += 1
+                else:
+                    counts['unchanged'] += 1  # touched in Anki, same text: only the mod moves
+                manifest.append({'deck': deck, 'guid': guid, 'mod': mod, 'content_hash': h, 'item_id': old[2], 'deleted': False})
+            if inserts or updates or retire or manifest:
+                with engine.begin() as conn:
+                    sync_chunk(conn, deck, inserts, updates, retire, manifest)
+
+    gone = [(guid, old) for guid, old in known.items() if guid not in seen and not old[3]]
+    # Legacy items left unclaimed: their note was deleted, or they duplicate an adopted one
+    orphans = [item_id for ids in legacy.values() for item_id, _ in ids]
+    with engine.begin() as conn:
+        retired = [old[2] for _, old in gone if old[2] is not None]
+        if retired or orphans:
+            conn.execute(ITEM_RETIRE, [{'_id': item_id} for item_id in retired + orphans])
+        if gone:
+            conn.execute(
+                update(AnkiNote.__table__)
+                .where(AnkiNote.__table__.c.deck == deck, AnkiNote.__table__.c.guid == bindparam('_guid'))
+                .values(deleted=True),
+                [{'_guid': guid} for guid, _ in gone],
+            )
+        # Items an earlier run imported under looser rules (e.g. without a translation) whose
+        # notes are unchanged since, so the loop above never looked at them again
+        counts['stale'] = conn.execute(
+            update(Item.__table__)
+            .where(Item.source == deck, Item.retired == false(), or_(Item.german == '', Item.english == ''))
+            .values(retired=True)
+        ).rowcount
+    counts['retired'] += len(retired)
+    counts['orphaned'] = len(orphans)
+    return deck, counts, time.monotonic() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--source-dir', '--extract-dir', dest='source_dir', default=EXTRACT_DIR,
+                        help='directory of .apkg files and/or unzipped deck directories')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--chunk-size', type=int, default=5000, help='notes per fetchmany and per insert')
+    parser.add_argument('--incremental', action='store_true', help='apply only changes since the last incremental run')
+    args = parser.parse_args()
+
+    sources = deck_sources(args.source_dir)
+
+    init_db()
+    started = time.monotonic()
+    total = changed = 0
+    task = sync_deck if args.incremental else load_deck
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker) as pool:
+        futures = {pool.submit(task, src, args.chunk_size): os.path.basename(src) for src in sources}
+        for fut in as_completed(futures):
+            try:
+                result = fut.result()
             except Exception as e:
-                print(f"Error processing {dir}: {e}")
+                print(f"Error processing {futures[fut]}: {e}")
+                continue
+            if args.incremental:
+                deck, counts, elapsed = result
+                notes = sum(n for k, n in counts.items() if k not in ('orphaned', 'stale'))
+                total += notes
+                changed += counts['inserted'] + counts['updated'] + counts['retired'] + counts['orphaned'] + counts['stale']
+                print(f"{deck}: " + ", ".join(f"{n} {k}" for k, n in counts.items()) + f" in {elapsed:.2f}s ({notes / max(elapsed, 1e-9):.0f} notes/s)")
+            else:
+                deck, written, skipped, elapsed = result
+                total += written
+                changed += written
+                print(f"{deck}: {written} rows, {skipped} skipped in {elapsed:.2f}s ({written / max(elapsed, 1e-9):.0f} rows/s)")
+
+    if changed:
+        with engine.begin() as conn:
+            bump_catalog_version(conn)
+        invalidate("items")
+    elapsed = time.monotonic() - started
+    noun = "notes checked" if args.incremental else "items imported"
+    print(f"{total} {noun} ({changed} changed) from {len(sources)} decks in {elapsed:.1f}s ({total / max(elapsed, 1e-9):.0f}/s)")
 
-    db.commit()
-    db.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,126 @@
+"""
+Copy deck audio into the content-addressed media store and link items to it.
+
+Every media file of each deck (an .apkg read in place, or an unzipped deck
+directory holding the `media` map and the numbered files) is streamed into
+MEDIA_DIR under its sha256, so the same recording shipped by several decks
+is stored once. Each note's first [sound:] reference then sets
+Item.audio_hash on the note's item, found through the anki_notes manifest
+or, for decks loaded without --incremental, by deck and German text.
+
+    python scripts/ingest_deck_media.py
+    python scripts/ingest_deck_media.py --source-dir GermanDB
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Add the backend directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'backend')))
+
+from sqlalchemy import select, update, bindparam
+from app.database import Item, AnkiNote, engine, init_db
+from app.media import MEDIA_DIR, store_media
+from app.catalog import bump_catalog_version
+from app.cache import invalidate
+from apkg import ApkgReader
+from import_unzipped_anki_decks import EXTRACT_DIR, deck_sources, open_collection, note_type_fields, note_text
+
+SOUND_REF_RE = re.compile(r'\[sound:([^\]]+)\]')
+
+
+def media_files(source):
+    """(name, opener) for every media file of a deck that is actually present."""
+    if source.endswith('.apkg'):
+        pkg = ApkgReader(source)
+        try:
+            for name in list(pkg.media):
+                yield name, lambda name=name: pkg.open_media(name)
+        finally:
+            pkg.close()
+        return
+    try:
+        with open(os.path.join(source, 'media'), 'rb') as f:
+            mapping = json.loads(f.read() or b'{}')
+    except (OSError, ValueError):
+        return
+    for member, name in mapping.items():
+        path = os.path.join(source, member)
+        if os.path.isfile(path):
+            yield name, lambda path=path: open(path, 'rb')
+
+
+def ingest_deck(source):
+    """Store a deck's media and set audio_hash on its items. Returns (deck, stats)."""
+    stats = dict.fromkeys(['files', 'new', 'bytes', 'linked', 'unmatched'], 0)
+    hashes = {}
+    for name, opener in media_files(source):
+        with opener() as stream:
+            digest, size, new = store_media(stream)
+        hashes[name] = digest
+        stats['files'] += 1
+        stats['new'] += new
+        stats['bytes'] += size * new
+
+    links = []
+    with open_collection(source) as (deck, con):
+        if not hashes:
+            return deck, stats
+        with engine.connect() as conn:
+            by_guid = dict(conn.execute(select(AnkiNote.guid, AnkiNote.item_id).where(AnkiNote.deck == deck)).all())
+            by_text = {} if by_guid else dict(conn.execute(select(Item.german, Item.id).where(Item.source == deck)).all())
+        fields = note_type_fields(con)
+        for guid, mid, flds in con.execute("SELECT guid, mid, flds FROM notes"):
+            digest = next((hashes[n] for n in SOUND_REF_RE.findall(flds) if n in hashes), None)
+            if digest is None:
+                continue
+            item_id = by_guid.get(guid) if by_guid else by_text.get(note_text(fields, mid, flds)[0])
+            if item_id is None:
+                stats['unmatched'] += 1
+                continue
+            links.append({'_id': item_id, 'audio_hash': digest})
+
+    if links:
+        with engine.begin() as conn:
+            conn.execute(
+                update(Item.__table__).where(Item.__table__.c.id == bindparam('_id')).values(audio_hash=bindparam('audio_hash')),
+                links,
+            )
+    stats['linked'] = len(links)
+    return deck, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--source-dir', default=EXTRACT_DIR, help='directory of .apkg files and/or unzipped deck directories')
+    args = parser.parse_args()
+
+    init_db()
+    started = time.monotonic()
+    linked = 0
+    for source in deck_sources(args.source_dir):
+        try:
+            deck, stats = ingest_deck(source)
+        except Exception as e:
+            print(f"Error processing {os.path.basename(source)}: {e}")
+            continue
+        linked += stats['linked']
+        print(f"{deck}: {stats['files']} files ({stats['new']} new, {stats['bytes'] / 1e6:.1f} MB), "
+              f"{stats['linked']} items linked, {stats['unmatched']} notes without an item")
+
+    if linked:
+        with engine.begin() as conn:
+            bump_catalog_version(conn)
+        invalidate("items")
+    print(f"Media store {MEDIA_DIR}: done in {time.monotonic() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
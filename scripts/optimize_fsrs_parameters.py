@@ -0,0 +1,118 @@
+
+"""
+Fit per-user FSRS parameters from the review log.
+
+Streams the `reviews` table with a server-side cursor, groups it by user and
+fits each user's weights in a process pool. Results are upserted into
+`user_fsrs_params`, which the backend scheduler reads on every review.
+
+    python scripts/optimize_fsrs_parameters.py --workers 8 --min-reviews 400
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import datetime as dt
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Add the backend directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'backend')))
+
+from app.database import engine, init_db, upsert, UserFSRSParams
+from app.srs import iter_user_reviews
+
+WRITE_BATCH = 200
+
+
+def fit_user(user_id, reviews):
+    """Worker: fit one user's parameters. Returns (user_id, parameters, review_count)."""
+    import torch
+    from fsrs import Optimizer, ReviewLog, Rating
+
+    torch.set_num_threads(1)  # one core per worker; the pool provides the parallelism
+    logs = [
+        ReviewLog(
+            card_id=item_id,
+            rating=Rating(rating),
+            review_datetime=reviewed_at.replace(tzinfo=dt.timezone.utc),
+            review_duration=response_ms or None,
+        )
+        for item_id, rating, reviewed_at, response_ms in reviews
+        if rating in (1, 2, 3, 4)
+    ]
+    return user_id, Optimizer(logs).compute_optimal_parameters(), len(logs)
+
+
+def save(rows):
+    with engine.begin() as conn:
+        upsert(conn, UserFSRSParams.__table__, rows, ["user_id"], ["parameters", "review_count", "fitted_at"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--chunk-size', type=int, default=20000, help='rows fetched per cursor round trip')
+    parser.add_argument('--min-reviews', type=int, default=400, help='skip users with fewer reviews')
+    parser.add_argument('--only-users', type=lambda v: [int(x) for x in v.split(',')], default=None)
+    args = parser.parse_args()
+
+    try:
+        import torch  # noqa: F401
+    except ImportError:
+        sys.exit('The FSRS optimizer needs torch: pip install "fsrs[optimizer]"')
+
+    init_db()
+    started = time.monotonic()
+    fitted = skipped = failed = reviews_seen = 0
+    pending, out = set(), []
+
+    def drain(done):
+        nonlocal fitted, failed
+        for fut in done:
+            try:
+                user_id, params, count = fut.result()
+            except Exception as e:
+                failed += 1
+                print(f"Fit failed: {e}")
+                continue
+            fitted += 1
+            out.append({
+                "user_id": user_id,
+                "parameters": json.dumps(list(params)),
+                "review_count": count,
+                "fitted_at": dt.datetime.utcnow(),
+            })
+        if len(out) >= WRITE_BATCH:
+            save(out)
+            out.clear()
+
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        for user_id, reviews in iter_user_reviews(engine, args.chunk_size, user_ids=args.only_users):
+            reviews_seen += len(reviews)
+            if len(reviews) < args.min_reviews:
+                skipped += 1
+                continue
+            # Bound the in-flight work so the stream, not the pool queue, sets memory use.
+            if len(pending) >= args.workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                drain(done)
+                elapsed = time.monotonic() - started
+                print(f"{fitted} users fitted, {reviews_seen} reviews read, {fitted / elapsed:.1f} users/s")
+            pending.add(pool.submit(fit_user, user_id, reviews))
+        drain(pending)
+    save(out)
+
+    elapsed = time.monotonic() - started
+    print(
+        f"Done in {elapsed:.1f}s: {fitted} fitted, {skipped} below --min-reviews, {failed} failed, "
+        f"{reviews_seen} reviews ({fitted / elapsed:.1f} users/s, {reviews_seen / elapsed:.0f} reviews/s)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+
+"""
+Rebuild user_srs from the review log.
+
+Replays every user's reviews in reviewed_at order with their current FSRS
+parameters (see optimize_fsrs_parameters.py) and writes stability,
+difficulty, due and last_reviewed back with bulk upserts. Users are sharded
+across worker processes.
+
+    python scripts/replay_reviews.py                        # full recompute
+    python scripts/replay_reviews.py --since 2025-01-01     # users active since
+    python scripts/replay_reviews.py --only-users 3,17 --dry-run
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import datetime as dt
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Add the backend directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'backend')))
+
+from sqlalchemy import select
+from app.database import engine, init_db, upsert, UserSRS, UserFSRSParams
+from app.srs import iter_user_reviews, get_engine
+
+SRS_COLUMNS = ["stability", "difficulty", "due", "last_reviewed"]
+
+
+def replay_shard(shard, parameters):
+    """Worker: replay a list of (user_id, reviews) and return user_srs rows."""
+    rows = []
+    for user_id, reviews in shard:
+        # Unfuzzed so that re-running the job is deterministic.
+        engine_ = get_engine(parameters.get(user_id), enable_fuzzing=False)
+        for item_id, card in engine_.replay(reviews).items():
+            rows.append({
+                "user_id": user_id,
+                "item_id": item_id,
+                "stability": card.stability,
+                "difficulty": card.difficulty,
+                "due": card.due.replace(tzinfo=None),
+                "last_reviewed": card.last_review.replace(tzinfo=None) if card.last_review else None,
+            })
+    return rows
+
+
+def diff(conn, rows, stats, show):
+    """Compare replayed rows with what is stored, for --dry-run."""
+    user_ids = {r["user_id"] for r in rows}
+    current = {
+        (r.user_id, r.item_id): r
+        for r in conn.execute(select(UserSRS).where(UserSRS.user_id.in_(user_ids)))
+    }
+    for r in rows:
+        old = current.get((r["user_id"], r["item_id"]))
+        if old is None:
+            stats["new"] += 1
+            continue
+        changed = (
+            abs((old.stability or 0) - r["stability"]) > 1e-6
+            or abs((old.difficulty or 0) - r["difficulty"]) > 1e-6
+            or old.due != r["due"]
+        )
+        if not changed:
+            stats["unchanged"] += 1
+            continue
+        stats["changed"] += 1
+        if stats["changed"] <= show:
+            print(
+                f"  user {r['user_id']} item {r['item_id']}: "
+                f"S {old.stability or 0:.2f}->{r['stability']:.2f}  "
+                f"D {old.difficulty or 0:.2f}->{r['difficulty']:.2f}  "
+                f"due {old.due}->{r['due']}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--chunk-size', type=int, default=20000, help='rows fetched per cursor round trip')
+    parser.add_argument('--shard-reviews', type=int, default=50000, help='reviews per worker task')
+    parser.add_argument('--only-users', type=lambda v: [int(x) for x in v.split(',')], default=None)
+    parser.add_argument('--since', type=dt.datetime.fromisoformat, default=None,
+                        help='only replay users with a review at or after this time')
+    parser.add_argument('--dry-run', action='store_true', help='report the diff without writing')
+    parser.add_argument('--show', type=int, default=20, help='changed rows to print in --dry-run')
+    args = parser.parse_args()
+
+    init_db()
+    started = time.monotonic()
+    with engine.connect() as conn:
+        parameters = {
+            user_id: tuple(json.loads(p))
+            for user_id, p in conn.execute(select(UserFSRSParams.user_id, UserFSRSParams.parameters))
+        }
+
+    users = reviews_seen = written = 0
+    stats = {"new": 0, "changed": 0, "unchanged": 0}
+    pending = set()
+
+    def drain(done):
+        nonlocal written
+        for fut in done:
+            rows = fut.result()
+            with engine.begin() as conn:
+                if args.dry_run:
+                    diff(conn, rows, stats, args.show)
+                else:
+                    upsert(conn, UserSRS.__table__, rows, ["user_id", "item_id"], SRS_COLUMNS)
+            written += len(rows)
+
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        shard, shard_size = [], 0
+
+        def submit():
+            nonlocal pending
+            if len(pending) >= args.workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                drain(done)
+            pending.add(pool.submit(replay_shard, shard, {u: parameters[u] for u, _ in shard if u in parameters}))
+
+        for user_id, reviews in iter_user_reviews(engine, args.chunk_size, user_ids=args.only_users, since=args.since):
+            users += 1
+            reviews_seen += len(reviews)
+            shard.append((user_id, reviews))
+            shard_size += len(reviews)
+            if shard_size >= args.shard_reviews:
+                submit()
+                shard, shard_size = [], 0
+        if shard:
+            submit()
+        drain(pending)
+
+    elapsed = time.monotonic() - started
+    action = "compared" if args.dry_run else "written"
+    print(
+        f"Replayed {users} users / {reviews_seen} reviews in {elapsed:.1f}s "
+        f"({users / max(elapsed, 1e-9):.0f} users/s); {written} user_srs rows {action}"
+    )
+    if args.dry_run:
+        print(f"Dry run: {stats['changed']} changed, {stats['new']} new, {stats['unchanged']} unchanged")
+
+
+if __name__ == "__main__":
+    main()
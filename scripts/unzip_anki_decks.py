@@ -1,16 +1,35 @@
 
 import os
-import zipfile
+import json
+import shutil
+import argparse
 
-ANKI_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'germandb'))
-EXTRACT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'germandb', 'extracted'))
+from apkg import ApkgReader
+
+ANKI_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'GermanDB'))
+EXTRACT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'GermanDB', 'extracted'))
 
 def main():
+    # The importers read .apkg files directly; this is only needed to inspect a deck by hand.
+    # Members keep their names inside the package (collection.anki21 or .anki2, numbered
+    # media files plus the `media` map), the layout the importers expect of a deck directory.
+    parser = argparse.ArgumentParser(description='Unpack the collection (and optionally media) of each .apkg')
+    parser.add_argument('--with-media', action='store_true', help='also write the media files and their `media` map')
+    args = parser.parse_args()
+
     for file in os.listdir(ANKI_DIR):
         if file.endswith(".apkg"):
             try:
-                with zipfile.ZipFile(os.path.join(ANKI_DIR, file), 'r') as zip_ref:
-                    zip_ref.extractall(os.path.join(EXTRACT_DIR, file.replace(".apkg", "")))
+                with ApkgReader(os.path.join(ANKI_DIR, file)) as pkg:
+                    out = os.path.join(EXTRACT_DIR, pkg.name)
+                    os.makedirs(out, exist_ok=True)
+                    shutil.copyfile(pkg.collection_path(), os.path.join(out, pkg.collection_member()))
+                    if args.with_media:
+                        for name, member in pkg.media.items():
+                            with pkg.open_media(name) as src, open(os.path.join(out, os.path.basename(member)), 'wb') as dst:
+                                shutil.copyfileobj(src, dst)
+                        with open(os.path.join(out, 'media'), 'w', encoding='utf-8') as f:
+                            json.dump({member: name for name, member in pkg.media.items()}, f)
             except Exception as e:
                 print(f"Error processing {file}: {e}")
 